@@ -0,0 +1,86 @@
+# Times the real sql_client functions, run through the database executor like the bot does, against a throwaway
+# database. Each case runs in a fresh process with its own config, comparing a commit per write with group commits
+# and with the write-behind wallet cache. Run from anywhere: python scripts/group_commit_benchmark.py
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEMBERS = 500
+ROUNDS = 5
+# commands in flight at once, like members using the bot at the same time
+CONCURRENCY = 20
+
+CASES = [
+    ('commit per write', {'groupCommitWindowMs': 0}),
+    ('group commit', {'groupCommitWindowMs': 50}),
+    ('write-behind', {'groupCommitWindowMs': 50, 'walletWriteBehind': True}),
+]
+
+
+async def run_all(calls):
+    """Runs (func, args) pairs through the database executor, CONCURRENCY at a time, and returns the seconds taken"""
+    from src import db_executor
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def run(func, args):
+        async with semaphore:
+            await db_executor.run(func, *args)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(func, args) for func, args in calls))
+    return time.perf_counter() - start
+
+
+async def bench():
+    from src import db_executor, sql_client
+    from src.models import TABLES, database
+
+    def init():
+        database.connect(reuse_if_open=True)
+        sql_client.create_tables()
+        database.create_tables(TABLES)
+        sql_client.load_leaderboard()
+
+    await db_executor.run(init)
+    members = range(1, MEMBERS + 1)
+    results = {}
+    results['update_coin'] = await run_all(
+        [(sql_client.update_coin, (member, 1000 + r)) for r in range(ROUNDS) for member in members]
+    )
+    results['get_coin'] = await run_all(
+        [(sql_client.get_coin, (member,)) for _ in range(ROUNDS) for member in members]
+    )
+    results['transfer_coin'] = await run_all(
+        [(sql_client.transfer_coin, (member, member % MEMBERS + 1, 1, -1000, 1000)) for _ in range(ROUNDS)
+         for member in members]
+    )
+    results['add_trivia_response'] = await run_all(
+        [(sql_client.add_trivia_response, (1, r, member, member % 2 == 0)) for r in range(ROUNDS) for member in members]
+    )
+    db_executor.shutdown()
+    return results
+
+
+def run_case(settings):
+    from src import config
+
+    with tempfile.TemporaryDirectory() as directory:
+        config._config_map = {'dbFile': os.path.join(directory, 'bench.db'), 'logLevel': 'WARNING', **settings}
+        return asyncio.run(bench())
+
+
+if __name__ == '__main__':
+    calls = ROUNDS * MEMBERS
+    for name, settings in CASES:
+        # a fresh process per case, the database and group commit window are set up on import
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            results = pool.apply(run_case, (settings,))
+        print(name)
+        for function, elapsed in results.items():
+            print(f'  {function:<20} {calls:>6} calls {elapsed:8.2f}s {calls / elapsed:10.0f} calls/s')
@@ -1,5 +1,11 @@
-import config
+import os
 import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import config
+from src.api_handlers.trivia_handler import question_digest
 import discord
 from discord.ext import commands
 
@@ -26,7 +32,7 @@ async def on_ready():
             index = lines[0].find('>')
             if index != -1:
                 question = lines[0][index + 1:].strip()
-                questions.append((hash(question),))
+                questions.append((question_digest(question),))
 
 
     connection = sqlite3.connect(config.get_attribute('dbFile'))
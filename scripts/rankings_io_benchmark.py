@@ -0,0 +1,82 @@
+# Compares the old rankings image path (icons read from their files, chart saved to ../tmp/rankings, read back
+# for the upload and deleted) against the in-memory pipeline (icon bytes decoded from buffers, chart saved into
+# BytesIO). Drawing is identical in both, so the difference is the disk round trip. Runs in a throwaway directory.
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import imread
+from matplotlib.offsetbox import AnnotationBbox, OffsetImage
+from PIL import Image, ImageDraw
+
+MEMBERS = 20
+ROUNDS = 10
+
+
+def make_icons(directory):
+    mask = Image.new('L', (44, 44))
+    ImageDraw.Draw(mask).ellipse((0, 0, 44, 44), fill=255)
+    icons = []
+    for i in range(MEMBERS):
+        img = Image.new('RGB', (44, 44), (i * 12 % 256, 80, 160))
+        img.putalpha(mask)
+        buffer = BytesIO()
+        img.save(buffer, 'PNG')
+        path = os.path.join(directory, f'{i}-44px.png')
+        with open(path, 'wb') as icon_file:
+            icon_file.write(buffer.getvalue())
+        icons.append((path, buffer.getvalue()))
+    return icons
+
+
+def draw(images, save):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    amounts = list(range(1, MEMBERS + 1))
+    ax.barh(range(MEMBERS), amounts)
+    for i, img in enumerate(images):
+        ab = AnnotationBbox(OffsetImage(img, zoom=0.65), (amounts[i], i), frameon=False, pad=0)
+        ax.add_artist(ab)
+    save(fig)
+
+
+def file_pipeline(directory, icons):
+    """Before: icons read from disk, chart written to a file, read back for the upload, then removed"""
+    rankings = os.path.join(directory, 'rankings')
+    os.makedirs(rankings, exist_ok=True)
+    for _ in range(ROUNDS):
+        path = os.path.join(rankings, 'power-rankings.png')
+        draw([imread(icon_path) for icon_path, _ in icons],
+             lambda fig: fig.savefig(path, bbox_inches='tight', pad_inches=0.5))
+        with open(path, 'rb') as image_file:
+            image_file.read()
+        os.remove(path)
+
+
+def memory_pipeline(directory, icons):
+    """After: icon bytes decoded from buffers and the chart kept in a BytesIO handed straight to discord.File"""
+    for _ in range(ROUNDS):
+        buffer = BytesIO()
+        draw([imread(BytesIO(icon), format='png') for _, icon in icons],
+             lambda fig: fig.savefig(buffer, format='png', bbox_inches='tight', pad_inches=0.5))
+        buffer.getvalue()
+
+
+def bench(name, func):
+    with tempfile.TemporaryDirectory() as directory:
+        icons = make_icons(directory)
+        start = time.perf_counter()
+        func(directory, icons)
+        elapsed = time.perf_counter() - start
+    print(f'{name:<8} {ROUNDS:>4} charts {elapsed:8.2f}s {1000 * elapsed / ROUNDS:8.1f} ms/chart')
+
+
+if __name__ == '__main__':
+    bench('file', file_pipeline)
+    bench('memory', memory_pipeline)
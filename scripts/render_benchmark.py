@@ -0,0 +1,62 @@
+# Compares the matplotlib and Pillow rankings chart backends at several leaderboard sizes.
+# Each case runs in a fresh process so the peak memory includes importing the backend.
+# Run from the src folder next to config.yml, like the bot: python ../scripts/render_benchmark.py
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = [10, 100, 1000]
+ROUNDS = 3
+
+
+def make_chart(members):
+    from PIL import Image
+
+    from src.avatar_cache import make_icon
+    from src.chart_renderer import BarChart
+
+    buffer = BytesIO()
+    Image.new('RGB', (128, 128), (120, 180, 90)).save(buffer, 'PNG')
+    icon = make_icon(buffer.getvalue())
+    return BarChart(
+        title='Cactus Gang Power Rankings\n01-01-2024',
+        xlabel='Coin (¢)',
+        names=[f'member {i}' for i in range(members)],
+        amounts=[(i * 7919) % 5000 - 500 for i in range(members)],
+        colors=[((i * 37) % 256 / 255, 0.4, 0.8) for i in range(members)],
+        icons=[icon] * members,
+    )
+
+
+def run_case(backend, members):
+    from src.chart_renderer import BACKENDS
+
+    chart = make_chart(members)
+    render = BACKENDS[backend]
+    start = time.perf_counter()
+    render(chart)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        image = render(chart)
+    warm = (time.perf_counter() - start) / ROUNDS
+    # ru_maxrss is in kilobytes on Linux
+    return first, warm, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, len(image)
+
+
+def bench(backend, members):
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        first, warm, peak_mb, size = pool.apply(run_case, (backend, members))
+    print(f'{backend:<11} {members:>5} members {1000 * first:9.1f} ms first {1000 * warm:9.1f} ms warm '
+          f'{peak_mb:8.1f} MB peak {size / 1024:8.1f} KB png')
+
+
+if __name__ == '__main__':
+    for size in SIZES:
+        for name in ('matplotlib', 'pillow'):
+            bench(name, size)
@@ -0,0 +1,78 @@
+# Compares the old sql_client query style (str.format, commit per write, separate connections for raw queries
+# and models) against the real sql_client functions and models on their one shared connection with parameterized
+# queries. The wallet cache and group commits are turned off so only the query style and connection differ.
+# Runs against a throwaway database file. Run from anywhere: python scripts/sql_benchmark.py
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEMBERS = 500
+ROUNDS = 20
+
+
+def setup(path):
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=wal')
+    connection.execute('CREATE TABLE IF NOT EXISTS AMOUNTS (id integer PRIMARY KEY, coin integer, correct_answers integer, incorrect_answers integer)')
+    connection.executemany('INSERT INTO AMOUNTS(id, coin) VALUES (?, ?)', [(i, 1000) for i in range(MEMBERS)])
+    connection.commit()
+    connection.close()
+
+
+def formatted_queries(path):
+    """Before: SQL built with str.format on one connection while a second connection handles the model queries"""
+    raw = sqlite3.connect(path, isolation_level='')
+    models = sqlite3.connect(path, isolation_level=None)
+    for _ in range(ROUNDS):
+        for member_id in range(MEMBERS):
+            raw.execute("SELECT coin from AMOUNTS WHERE id IS '{0}'".format(member_id)).fetchone()
+            raw.execute(
+                "INSERT INTO AMOUNTS(id, coin) VALUES ('{0}', {1}) ON CONFLICT(id) DO UPDATE SET coin=excluded.coin".format(
+                    member_id, member_id))
+            raw.commit()
+            models.execute('SELECT id, coin FROM AMOUNTS WHERE id = ?', (member_id,)).fetchone()
+    raw.close()
+    models.close()
+    return ROUNDS * MEMBERS * 3
+
+
+def sql_client_queries(path):
+    """After: sql_client's get_coin and update_coin and a model read, all on the shared peewee connection"""
+    from src import config
+
+    # no wallet cache and a commit per write, like the old code
+    config._config_map = {'dbFile': path, 'walletCacheSize': 0, 'groupCommitWindowMs': 0}
+    from src import sql_client
+    from src.models import Amount, TABLES, database
+
+    database.connect(reuse_if_open=True)
+    database.create_tables(TABLES)
+    for _ in range(ROUNDS):
+        for member_id in range(MEMBERS):
+            sql_client.get_coin(member_id)
+            sql_client.update_coin(member_id, member_id)
+            Amount.get_or_none(Amount.id == member_id)
+    database.close()
+    return ROUNDS * MEMBERS * 3
+
+
+def bench(name, func):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        setup(path)
+        start = time.perf_counter()
+        queries = func(path)
+        elapsed = time.perf_counter() - start
+    return f'{name:<15} {queries:>8} queries {elapsed:8.2f}s {queries / elapsed:10.0f} queries/s'
+
+
+if __name__ == '__main__':
+    # a fresh process per case, the shared connection and its settings are set up on import
+    for name, func in [('formatted', formatted_queries), ('sql_client', sql_client_queries)]:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            print(pool.apply(bench, (name, func)))
@@ -0,0 +1,228 @@
+import asyncio
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from enum import IntEnum
+from heapq import heappop, heappush
+import itertools
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import aiohttp
+import discord
+
+from src import config, stats
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Lower goes first, so people waiting on a reply are never stuck behind a bulk role job"""
+
+    INTERACTION = 0
+    MESSAGE = 1
+    ROLE_SYNC = 2
+
+
+@dataclass(order=True)
+class _Action:
+    priority: int
+    seq: int
+    kind: str = field(compare=False)
+    bucket: str = field(compare=False)
+    factory: Callable[[], Awaitable] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    queued_at: float = field(compare=False)
+    idempotent: bool = field(default=True, compare=False)
+    attempt: int = field(default=0, compare=False)
+
+
+class _KindStats:
+    def __init__(self) -> None:
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+
+def _is_retryable(error: BaseException, idempotent: bool) -> bool:
+    """
+    Rate limits mean the request was refused, so anything can be retried after one. A server error or timeout
+    may come after the request went through, so only requests that are safe to repeat are retried after those.
+    """
+    if isinstance(error, discord.RateLimited):
+        return True
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or (idempotent and error.status >= 500)
+    return idempotent and isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+class ActionQueue:
+    """
+    Runs outbound Discord requests through one priority queue served by a fixed number of workers.
+    Requests sharing a rate limit bucket (a guild's roles, a channel's messages) run at most `bucket_limit`
+    at a time. Leaked rate limits, and server errors for requests that are safe to repeat, are retried with
+    jittered exponential backoff.
+    A request whose bucket is full is parked with its bucket instead of holding a worker, so a long role job
+    only ever occupies `bucket_limit` workers and replies keep flowing.
+    """
+
+    def __init__(self, workers: int, bucket_limit: int, max_retries: int, backoff: float) -> None:
+        self.worker_count = workers
+        self.bucket_limit = bucket_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        # requests running per bucket, and requests waiting for a full bucket in priority order
+        self._running: Counter = Counter()
+        self._parked: Dict[str, List[_Action]] = defaultdict(list)
+        self._seq = itertools.count()
+        self._kinds: Dict[str, _KindStats] = defaultdict(_KindStats)
+
+    def _ensure_workers(self) -> asyncio.PriorityQueue:
+        # started on first use, the queue and workers belong to the bot's event loop
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"action-worker-{i}") for i in range(self.worker_count)
+            ]
+        return self._queue
+
+    async def submit(
+        self,
+        kind: str,
+        bucket: str,
+        factory: Callable[[], Awaitable[T]],
+        priority: Priority = Priority.MESSAGE,
+        idempotent: bool = True,
+    ) -> T:
+        """
+        Queues a Discord request and waits for its result
+        :param kind: what the request does, statistics are kept per kind
+        :param bucket: requests with the same bucket share a concurrency limit
+        :param factory: makes the request, called again for each retry
+        :param priority:
+        :param idempotent: False for requests that create something (sends, replies, new roles), which are only
+            retried after a rate limit so a request that went through despite an error is never repeated
+        :return: whatever the request returns, or raises its error once retries run out
+        """
+        queue = self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait(
+            _Action(priority, next(self._seq), kind, bucket, factory, future, time.monotonic(), idempotent)
+        )
+        return await future
+
+    async def _worker(self) -> None:
+        while True:
+            action = await self._queue.get()
+            try:
+                await self._run(action)
+            except Exception:
+                logging.exception(f"Action queue worker failed running {action.kind}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, action: _Action) -> None:
+        if action.future.done():
+            # the caller was cancelled while this waited
+            return
+        if self._running[action.bucket] >= self.bucket_limit:
+            heappush(self._parked[action.bucket], action)
+            return
+        self._running[action.bucket] += 1
+        try:
+            await self._attempt(action)
+        finally:
+            self._running[action.bucket] -= 1
+            parked = self._parked.get(action.bucket)
+            if parked:
+                self._queue.put_nowait(heappop(parked))
+            if not parked:
+                self._parked.pop(action.bucket, None)
+                if not self._running[action.bucket]:
+                    del self._running[action.bucket]
+
+    async def _attempt(self, action: _Action) -> None:
+        kind = self._kinds[action.kind]
+        started = time.monotonic()
+        if action.attempt == 0:
+            wait = started - action.queued_at
+            kind.total_wait += wait
+            kind.max_wait = max(kind.max_wait, wait)
+        try:
+            result = await action.factory()
+        except Exception as e:
+            kind.total_run += time.monotonic() - started
+            if action.attempt < self.max_retries and _is_retryable(e, action.idempotent):
+                delay = self.backoff * 2 ** action.attempt * random.uniform(0.5, 1.5)
+                if isinstance(e, discord.RateLimited):
+                    delay = max(delay, e.retry_after)
+                action.attempt += 1
+                kind.retries += 1
+                logging.debug(f"Retrying {action.kind} in {delay:.2f}s after {e}")
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, action)
+                return
+            kind.failed += 1
+            if not action.future.done():
+                action.future.set_exception(e)
+            return
+        kind.total_run += time.monotonic() - started
+        kind.completed += 1
+        if not action.future.done():
+            action.future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        values: Dict[str, Any] = {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "parked": sum(len(parked) for parked in self._parked.values()),
+            "busy_buckets": len(self._running),
+        }
+        for name, kind in sorted(self._kinds.items()):
+            runs = kind.completed + kind.failed
+            values[name] = (
+                f"{runs} runs, {kind.failed} failed, {kind.retries} retries, "
+                f"wait {1000 * kind.total_wait / max(runs, 1):.0f} ms avg / {1000 * kind.max_wait:.0f} ms max, "
+                f"run {1000 * kind.total_run / max(runs, 1):.0f} ms avg"
+            )
+        return values
+
+
+action_queue = ActionQueue(
+    config.get_attribute("actionQueueWorkers", 8),
+    config.get_attribute("actionBucketConcurrency", 2),
+    config.get_attribute("actionMaxRetries", 3),
+    config.get_attribute("actionRetryBackoffMs", 500) / 1000,
+)
+stats.register("action queue", action_queue.get_stats)
+
+
+async def respond(interaction: discord.Interaction, *args, **kwargs) -> None:
+    """Answers an interaction ahead of everything else in the queue"""
+    await action_queue.submit(
+        "interaction response",
+        f"interaction:{interaction.id}",
+        lambda: interaction.response.send_message(*args, **kwargs),
+        Priority.INTERACTION,
+        idempotent=False,
+    )
+
+
+async def send(channel: discord.abc.Messageable, **kwargs) -> discord.Message:
+    return await action_queue.submit(
+        "message send", f"channel:{getattr(channel, 'id', None)}", lambda: channel.send(**kwargs), idempotent=False
+    )
+
+
+async def edit(message: discord.Message, **kwargs) -> discord.Message:
+    return await action_queue.submit(
+        "message edit", f"channel:{message.channel.id}", lambda: message.edit(**kwargs)
+    )
+
+
+async def delete(message: discord.Message) -> None:
+    await action_queue.submit("message delete", f"channel:{message.channel.id}", message.delete)
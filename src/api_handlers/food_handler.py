@@ -1,10 +1,10 @@
+import asyncio
 import logging
 import random
-from typing import Any, Dict
-from openfoodfacts import API
-from openfoodfacts.types import COUNTRY_CODE_TO_NAME
+from typing import Any, Dict, List, Tuple
 from functools import lru_cache
 
+from src import db_executor
 from src.models import CountryAnswer, Food, database
 
 USER_AGENT = "CactusCoinBot/1.0"
@@ -21,10 +21,21 @@ def format_country(country: str) -> str:
     return " ".join(country_words)
 
 
-def generate_food_questions():
+FoodBatch = Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]
+
+
+def fetch_food_questions() -> List[FoodBatch]:
+    """
+    Pulls products from OpenFoodFacts and builds their answers, one (products, country answers) batch per country.
+    Only does network I/O, so it runs in a worker thread and never holds up the database thread.
+    """
+    # openfoodfacts is slow to import and only needed when the question pool runs dry
+    from openfoodfacts import API
+    from openfoodfacts.types import COUNTRY_CODE_TO_NAME
+
     # Come up with a randomized list of 20 counties
     country_codes = random.choices(list(COUNTRY_CODE_TO_NAME.keys()), k=20)
-    rows_inserted = 0
+    batches: List[FoodBatch] = []
     # Get food items for each of them
     for country_code in country_codes:
         # pull 20 products
@@ -74,12 +85,32 @@ def generate_food_questions():
                 wrong_countries_to_insert = [{"barcode": product["barcode"], "correct": False, "name": country_name} for country_name in wrong_answer_set]
                 correct_countries_to_insert = [{"barcode": product["barcode"], "correct": True, "name": country_name} for country_name in correct_answer_set]
                 new_countries += wrong_countries_to_insert + correct_countries_to_insert
-            
+
+            batches.append((new_products, new_countries))
+        except Exception as e:
+            logging.error(e)
+    return batches
+
+
+def store_food_questions(batches: List[FoodBatch]) -> int:
+    """Inserts fetched food questions, must be called from the database thread. Returns the number of foods added"""
+    rows_inserted = 0
+    for new_products, new_countries in batches:
+        try:
             # Make this a transaction so everything needs to be inserted at once
             logging.debug("about to send to db")
-            with database.atomic() as txn:
-                rows_inserted += Food.insert_many(new_products).execute()
+            with database.atomic():
+                Food.insert_many(new_products).execute()
                 CountryAnswer.insert_many(new_countries).execute()
+            # execute() gives back the last row id for inserts, not a count
+            rows_inserted += len(new_products)
         except Exception as e:
             logging.error(e)
     logging.info(f"{str(rows_inserted)} rows inserted.")
+    return rows_inserted
+
+
+async def generate_food_questions() -> int:
+    """Fetches new food questions in a worker thread, then stores them on the database thread"""
+    batches = await asyncio.to_thread(fetch_food_questions)
+    return await db_executor.run(store_food_questions, batches)
@@ -1,7 +1,12 @@
+import asyncio
+import hashlib
 from html import unescape
-from typing import Literal, List, Optional
+import logging
+from typing import Any, Dict, Literal, List, Optional
 from dataclasses import dataclass
-import requests
+import aiohttp
+
+from src import config, stats
 
 Difficulty = Literal['easy', 'medium', 'hard']
 QuestionType = Literal['boolean', 'multiple']
@@ -15,6 +20,15 @@ def html_decode(s):
     return unescape(s)
 
 
+def question_digest(question: str) -> int:
+    """
+    Stable signed 64-bit digest of a question's text. Unlike hash() this is the same in every process,
+    so it can be stored to recognise questions that have already been asked.
+    """
+    digest = hashlib.blake2b(question.strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
 @dataclass
 class Question:
     category: str
@@ -48,8 +62,11 @@ class Question:
             incorrect_answers=[html_decode(a) for a in json_dict['incorrect_answers']]
         )
 
+    def digest(self) -> int:
+        return question_digest(self.question)
+
     def __hash__(self):
-        return hash((self.question, self.type))
+        return self.digest()
 
 
 @dataclass
@@ -66,7 +83,98 @@ class TriviaResponse:
         )
 
 
-def get_trivia_questions(amount: str = '1', category: Optional[str] = None, difficulty: Optional[Difficulty] = None) -> List[Question]:
+# OpenTDB response codes, see https://opentdb.com/api_config.php
+NO_RESULTS = 1
+RATE_LIMITED = 5
+# OpenTDB allows one request every 5 seconds per IP
+RATE_LIMIT_SECONDS = 5
+
+
+class OpenTDBClient:
+    """
+    Async OpenTDB client sharing one HTTP session, so fetching questions never blocks the event loop
+    and reuses its connection. Rate limited and failed requests are retried with backoff.
+    """
+
+    API_URL = 'https://opentdb.com/api.php'
+
+    def __init__(self, timeout: float, max_retries: int) -> None:
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.questions = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # made on first use, a session belongs to the event loop it was created on
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def get_questions(self, amount: int = 1, category: Optional[str] = None,
+                            difficulty: Optional[Difficulty] = None) -> List[Question]:
+        """
+        Fetches trivia questions from https://opentdb.com/api_config.php
+        :param amount:
+        :param category:
+        :param difficulty:
+        :return: the questions, empty if OpenTDB has none matching or couldn't be reached
+        """
+        params = {'amount': str(amount)}
+        if category:
+            params['category'] = category
+        if difficulty:
+            params['difficulty'] = difficulty
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            try:
+                async with self._get_session().get(self.API_URL, params=params) as r:
+                    r.raise_for_status()
+                    body = await r.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f'OpenTDB request failed: {e!r}')
+            else:
+                if body['response_code'] == RATE_LIMITED:
+                    self.rate_limited += 1
+                elif body['response_code'] == NO_RESULTS:
+                    return []
+                else:
+                    response = TriviaResponse.from_json(body)
+                    self.questions += len(response.results)
+                    return response.results
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(RATE_LIMIT_SECONDS * 2 ** attempt)
+        self.failures += 1
+        return []
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "questions": self.questions,
+        }
+
+
+trivia_client = OpenTDBClient(
+    config.get_attribute('triviaRequestTimeoutSeconds', 10),
+    config.get_attribute('triviaMaxRetries', 3),
+)
+stats.register("trivia api", trivia_client.get_stats)
+
+
+async def get_trivia_questions(amount: str = '1', category: Optional[str] = None,
+                               difficulty: Optional[Difficulty] = None) -> List[Question]:
     """
     Uses https://opentdb.com/api_config.php to fetch a trivia question and converts it to a question object we can use
     :param amount:
@@ -74,11 +182,4 @@ def get_trivia_questions(amount: str = '1', category: Optional[str] = None, diff
     :param difficulty:
     :return:
     """
-    request_url = f'https://opentdb.com/api.php?amount={amount}'
-    if category:
-        request_url = request_url + f'&category={category}'
-    if difficulty:
-        request_url = request_url + f'&difficulty={difficulty}'
-    r = requests.get(request_url)
-    response = TriviaResponse.from_json(r.json())
-    return response.results
+    return await trivia_client.get_questions(int(amount), category, difficulty)
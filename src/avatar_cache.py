@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, Dict, Iterable, List, Optional
+
+import discord
+from PIL import Image, ImageDraw
+
+from src import config, stats
+
+ICON_SIZE = (44, 44)
+icon_mask = Image.new("L", (128, 128))
+mask_draw = ImageDraw.Draw(icon_mask)
+mask_draw.ellipse((0, 0, 128, 128), fill=255)
+
+
+def make_icon(avatar: bytes) -> bytes:
+    """Crops an avatar to a circle and shrinks it to icon size, returned as PNG bytes"""
+    img = Image.open(BytesIO(avatar)).convert("RGB")
+    img = img.resize((128, 128))
+    img.putalpha(icon_mask)
+    img = img.resize(ICON_SIZE)
+    buffer = BytesIO()
+    img.save(buffer, "PNG")
+    img.close()
+    return buffer.getvalue()
+
+
+class AvatarCache:
+    """
+    Masked 44px member icons keyed by display_avatar.key, which changes whenever a member changes avatar.
+    Icons live in a bounded in-memory LRU backed by a bounded folder of PNGs, both evicting the least
+    recently used icon. Misses are downloaded concurrently, at most `concurrency` at a time.
+    """
+
+    def __init__(self, directory: str, max_size: int, max_disk_size: int, concurrency: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self._icons: "OrderedDict[str, bytes]" = OrderedDict()
+        # keys of the icons on disk, least recently used first, read from the folder on first use
+        self._disk: Optional["OrderedDict[str, None]"] = None
+        self._fetching: Dict[str, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.downloads = 0
+        self.failed = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}-44px.png")
+
+    def _load_index(self) -> "OrderedDict[str, None]":
+        os.makedirs(self.directory, exist_ok=True)
+        entries = [
+            entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith("-44px.png")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        return OrderedDict((entry.name[: -len("-44px.png")], None) for entry in entries)
+
+    def _read(self, key: str) -> bytes:
+        path = self._path(key)
+        with open(path, "rb") as icon_file:
+            icon = icon_file.read()
+        # keeps the on-disk recency order across restarts
+        os.utime(path)
+        return icon
+
+    def _write(self, key: str, icon: bytes, evicted: List[str]) -> None:
+        with open(self._path(key), "wb") as icon_file:
+            icon_file.write(icon)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, member: discord.Member) -> Optional[bytes]:
+        """A member's masked icon, None if their avatar couldn't be downloaded"""
+        avatar = member.display_avatar
+        icon = self._icons.get(avatar.key)
+        if icon is not None:
+            self.memory_hits += 1
+            self._icons.move_to_end(avatar.key)
+            return icon
+        # members sharing an avatar, like the default ones, wait on the same load
+        if avatar.key not in self._fetching:
+            self._fetching[avatar.key] = asyncio.ensure_future(self._load(avatar))
+        return await asyncio.shield(self._fetching[avatar.key])
+
+    async def get_many(self, members: Iterable[discord.Member]) -> List[Optional[bytes]]:
+        """Icons for several members in order, missing icons are loaded concurrently"""
+        return list(await asyncio.gather(*(self.get(member) for member in members)))
+
+    async def prewarm(self, members: Iterable[discord.Member]) -> None:
+        """Loads icons ahead of time so the first rankings don't wait on downloads"""
+        await self.get_many(members)
+        logging.info(f"Avatar cache warmed with {len(self._icons)} icons")
+
+    async def _load(self, avatar: discord.Asset) -> Optional[bytes]:
+        try:
+            if self._disk is None:
+                self._disk = await asyncio.to_thread(self._load_index)
+            if avatar.key in self._disk:
+                self.disk_hits += 1
+                self._disk.move_to_end(avatar.key)
+                icon = await asyncio.to_thread(self._read, avatar.key)
+            else:
+                async with self._semaphore:
+                    icon = await asyncio.to_thread(make_icon, await avatar.read())
+                self.downloads += 1
+                self._disk[avatar.key] = None
+                evicted = []
+                while len(self._disk) > self.max_disk_size:
+                    evicted.append(self._disk.popitem(last=False)[0])
+                    self.disk_evictions += 1
+                await asyncio.to_thread(self._write, avatar.key, icon, evicted)
+        except (discord.HTTPException, OSError, ValueError):
+            self.failed += 1
+            if self._disk is not None:
+                self._disk.pop(avatar.key, None)
+            logging.exception(f"Failed to load avatar {avatar.key}")
+            return None
+        finally:
+            self._fetching.pop(avatar.key, None)
+        self._icons[avatar.key] = icon
+        while len(self._icons) > self.max_size:
+            self._icons.popitem(last=False)
+            self.evictions += 1
+        return icon
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.downloads
+        return {
+            "memory": f"{len(self._icons)}/{self.max_size}",
+            "disk": f"{len(self._disk) if self._disk is not None else '?'}/{self.max_disk_size}",
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "downloads": self.downloads,
+            "hit_rate": f"{100 * (self.memory_hits + self.disk_hits) / lookups:.1f}%" if lookups else "n/a",
+            "failed": self.failed,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+avatar_cache = AvatarCache(
+    "../tmp/avatars",
+    config.get_attribute("avatarCacheSize", 256),
+    config.get_attribute("avatarDiskCacheSize", 2048),
+    config.get_attribute("avatarFetchConcurrency", 8),
+)
+stats.register("avatar cache", avatar_cache.get_stats)
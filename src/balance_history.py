@@ -0,0 +1,100 @@
+import json
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pytz import timezone
+
+from src import group_commit
+from src.models import BalanceDaily, database
+
+# Buffered balances are written with one upsert when the group commit batch closes, or once this many pile up
+MAX_PENDING = 500
+
+# each member's latest balance per day since the last flush, so a busy day still costs one row
+_pending: Dict[Tuple[int, date], int] = {}
+
+
+def today() -> date:
+    """The bot's calendar day, the same one the rankings are dated with"""
+    return datetime.now(timezone("US/Eastern")).date()
+
+
+def record(member_id: int, balance: Optional[int], durable: bool = False) -> None:
+    """
+    Sets a member's closing balance for today. Must be called from the database thread.
+    :param member_id:
+    :param balance:
+    :param durable: write and commit the row before returning
+    :return:
+    """
+    record_many([(member_id, balance)], durable=durable)
+
+
+def record_many(balances: Iterable[Tuple[int, Optional[int]]], durable: bool = False) -> None:
+    """Sets today's closing balance for several (member_id, balance) pairs, members without a wallet are skipped"""
+    day = today()
+    for member_id, balance in balances:
+        if balance is not None:
+            _pending[(member_id, day)] = balance
+    if durable or not group_commit.in_batch() or len(_pending) >= MAX_PENDING:
+        flush(durable)
+
+
+def flush(durable: bool = False) -> None:
+    """Writes all buffered balances"""
+    if not _pending:
+        return
+    rows = [{"member_id": member_id, "day": day, "balance": balance} for (member_id, day), balance in _pending.items()]
+    _pending.clear()
+    with group_commit.write(durable):
+        for start in range(0, len(rows), MAX_PENDING):
+            BalanceDaily.insert_many(rows[start:start + MAX_PENDING]).on_conflict(
+                conflict_target=[BalanceDaily.member_id, BalanceDaily.day],
+                preserve=[BalanceDaily.balance],
+            ).execute()
+
+
+def get_history(member_ids: List[int], since: date) -> Dict[int, List[Tuple[date, int]]]:
+    """
+    Each member's (day, balance) points from `since` onwards, oldest first. The last balance from before
+    `since` is moved onto `since` so every line starts at the left edge of the chart.
+    :param member_ids:
+    :param since:
+    :return:
+    """
+    flush()
+    ids = json.dumps(member_ids)
+    day = since.isoformat()
+    rows = database.execute_sql(
+        "SELECT member_id, day, balance, 0 FROM BALANCE_DAILY "
+        "WHERE member_id IN (SELECT value FROM json_each(?)) AND day >= ? "
+        "UNION ALL "
+        "SELECT b.member_id, ?, b.balance, 1 FROM BALANCE_DAILY b "
+        "WHERE b.member_id IN (SELECT value FROM json_each(?)) AND b.day = "
+        "(SELECT MAX(day) FROM BALANCE_DAILY WHERE member_id = b.member_id AND day < ?) "
+        "ORDER BY 1, 2, 4",
+        (ids, day, day, ids, day),
+    ).fetchall()
+    history: Dict[int, List[Tuple[date, int]]] = {member_id: [] for member_id in member_ids}
+    for member_id, day, balance, _carried in rows:
+        day = date.fromisoformat(day) if isinstance(day, str) else day
+        points = history[member_id]
+        # a balance recorded on `since` itself wins over the one carried forward
+        if points and points[-1][0] == day:
+            continue
+        points.append((day, balance))
+    return history
+
+
+def remove_histories(member_ids: List[int], durable: bool = False) -> int:
+    """Removes every daily balance for all the given members in one statement, returns the number of rows removed"""
+    removed = set(member_ids)
+    for key in [key for key in _pending if key[0] in removed]:
+        del _pending[key]
+    with group_commit.write(durable):
+        return database.execute_sql(
+            "DELETE FROM BALANCE_DAILY WHERE member_id IN (SELECT value FROM json_each(?))", (json.dumps(member_ids),)
+        ).rowcount
+
+
+group_commit.add_flush_hook(flush)
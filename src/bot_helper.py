@@ -1,59 +1,158 @@
-from datetime import datetime
+import asyncio
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 import logging
-from io import BytesIO
-import os
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Set, Tuple
 
 import discord
-from PIL import Image, ImageDraw
-import matplotlib.pyplot as plt
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from pytz import timezone
 
-from src import config
-from src.sql_client import get_coin, add_transaction, get_coin_rankings, update_coin
-from src.models import Amount, Transaction
-
-# Matplotlib styling
-plt.style.use("dark_background")
-for param in ["text.color", "axes.labelcolor", "xtick.color", "ytick.color"]:
-    plt.rcParams[param] = "0.9"  # very light grey
-for param in ["figure.facecolor", "axes.facecolor", "savefig.facecolor"]:
-    plt.rcParams[param] = "#212946"  # bluish dark grey
-plt.rcParams["font.family"] = "Tahoma"
-plt.rcParams["font.size"] = 16
-
-ICON_SIZE = (44, 44)
-icon_mask = Image.new("L", (128, 128))
-mask_draw = ImageDraw.Draw(icon_mask)
-mask_draw.ellipse((0, 0, 128, 128), fill=255)
-
-RANKINGS_FOLDER = "../tmp/rankings"
-
-
-async def create_role(guild: discord.Guild, amount: int):
-    """Creates a cactus coin role that denotes the amount of coin a member has."""
+from src import balance_history, config, db_executor, group_commit, ledger, role_tiers, sql_client, stats
+from src.action_queue import Priority, action_queue
+from src.avatar_cache import avatar_cache
+from src.chart_renderer import BarChart, LineChart, LineSeries, renderer
+from src.image_cache import rankings_cache
+from src.leaderboard import leaderboard
+from src.role_index import is_coin_role, role_index
+from src.role_scheduler import role_scheduler
+from src.sql_client import _load_coin, get_coin, update_coin
+from src.wallet_cache import MISSING, wallet_cache
+
+# most bars a rankings chart will draw
+MAX_RANKINGS_SIZE = 50
+# most members drawn on one balance history chart
+MAX_HISTORY_MEMBERS = 10
+# members whose roles are updated at once by bulk role jobs
+ROLE_JOB_BATCH_SIZE = 10
+
+# held while a member's coin is being changed, so changes to one member apply in order
+member_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+# held while a member's coin role is being edited, so role edits apply in order without holding up coin changes
+role_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+_background_tasks: Set[asyncio.Task] = set()
+# Discord requests made for coin roles by kind, and role syncs that did or didn't need an edit
+role_api_calls: Counter = Counter()
+role_syncs: Counter = Counter()
+# runs of the empty coin role sweep, with the roles it looked at and deleted
+role_sweeps: Counter = Counter()
+
+
+def _log_task_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logging.error(f"Background task {task.get_name()} failed", exc_info=task.exception())
+
+
+def run_in_background(coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+    """Starts a coroutine without waiting for it, keeping a reference so it isn't garbage collected"""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_task_error)
+    return task
+
+
+def get_role_stats() -> Dict[str, Any]:
+    calls = sum(role_api_calls.values())
+    return {
+        "syncs": role_syncs["applied"] + role_syncs["unchanged"],
+        "unchanged": role_syncs["unchanged"],
+        "api_calls": calls,
+        "calls_per_sync": f"{calls / role_syncs['applied']:.2f}" if role_syncs["applied"] else "n/a",
+        **{f"{kind}_calls": count for kind, count in sorted(role_api_calls.items())},
+        **{f"sweep_{kind}": count for kind, count in sorted(role_sweeps.items())},
+    }
+
+
+stats.register("roles", get_role_stats)
+
+
+def _role_request(
+    kind: str, guild: discord.Guild, factory: Callable[[], Awaitable[Any]], idempotent: bool = True
+) -> Awaitable[Any]:
+    """Queues a coin role request behind replies and messages, sharing the guild's role bucket"""
+    role_api_calls[kind] += 1
+    return action_queue.submit(f"role {kind}", f"roles:{guild.id}", factory, Priority.ROLE_SYNC, idempotent)
+
+
+async def create_role(guild: discord.Guild, name: str):
+    """Gets the cactus coin role with a name, creating it only if the guild doesn't have it yet."""
     # avoid duplicating roles whenever possible
-    prefix = config.get_attribute("rolePrefix", "Cactus Coin: ")
-    new_role_name = f'{prefix}{format(amount, ",d")}'
-    existing_role = [role for role in guild.roles if role.name == new_role_name]
+    existing_role = role_index.get_role(guild, name)
     if existing_role:
-        return existing_role[0]
-    return await guild.create_role(
-        name=new_role_name,
+        return existing_role
+    role = await _role_request("create", guild, lambda: guild.create_role(
+        name=name,
         reason="Cactus Coin: New CC amount.",
         color=discord.Color.dark_gold(),
-    )
+    ), idempotent=False)
+    role_index.add_role(role)
+    return role
+
+
+async def reconcile_roles(guild: discord.Guild, member: discord.Member, amount: Optional[int]):
+    """
+    Gives a member exactly the cactus coin role for an amount, or no coin role when the amount is None.
+    Works out the member's whole role list when the edit runs and applies it with one edit, skipping the edit
+    when nothing changes.
+    Coin roles the member leaves behind are left for the role sweep to delete once nobody has them.
+    :param guild:
+    :param member:
+    :param amount:
+    :return:
+    """
+    # the member passed in may be a stale snapshot, e.g. captured when a scheduled update was asked for
+    current = [role for role in (guild.get_member(member.id) or member).roles if is_coin_role(role)]
+    name = role_tiers.role_name(member.id, amount) if amount is not None else None
+    target = await create_role(guild, name) if name is not None else None
+    if target:
+        role_index.touch(target)
+    if current == ([target] if target else []):
+        role_syncs["unchanged"] += 1
+        return
+    reason = f"Cactus Coin: Role removed for {member.name}"
+    if target:
+        reason = f"Cactus Coin: Role updated for {member.name} to {str(amount)}"
+
+    def edit():
+        # the role list is read when the edit runs, so a queued or retried edit keeps roles given in the meantime
+        latest = guild.get_member(member.id) or member
+        roles = [role for role in latest.roles if not role.is_default() and not is_coin_role(role)]
+        if target:
+            roles.append(target)
+        return latest.edit(roles=roles, reason=reason)
+
+    await _role_request("edit", guild, edit)
+    role_syncs["applied"] += 1
 
 
 async def remove_role(guild: discord.Guild, member: discord.Member):
-    """Removes the cactus coin role from the member's role and from the guild if necessary"""
-    prefix = config.get_attribute("rolePrefix", "Cactus Coin: ")
-    cactus_roles = [role for role in member.roles if prefix in role.name]
-    if cactus_roles:
-        cactus_role = cactus_roles[0]
-        await member.remove_roles(cactus_role)
-        # if the current user is the only one with the role or there are no users with the role
-        await clear_old_roles(guild)
+    """
+    Removes the cactus coin role from the member, the role sweep deletes it from the guild once unused.
+    Called once their wallet is cleared, so an update still waiting from an earlier coin change is dropped too.
+    """
+    role_scheduler.cancel(guild, member)
+    async with role_locks[member.id]:
+        await reconcile_roles(guild, member, None)
+
+
+async def get_balance(member_id: int) -> Optional[int]:
+    """Gets a member's coin, straight from the wallet cache for members that have been looked up recently"""
+    cached = wallet_cache.get(member_id)
+    if cached is not MISSING:
+        return cached
+    return await db_executor.run(_load_coin, member_id)
+
+
+def _load_or_init_coin(member_id: int, default: int) -> Optional[int]:
+    """
+    Gets a member's coin, initializing their wallet with the default amount if it is empty.
+    Returns the stored coin, or None if the wallet was just initialized.
+    """
+    coin = get_coin(member_id)
+    if coin:
+        return coin
+    update_coin(member_id, default)
+    return None
 
 
 async def verify_coin(
@@ -63,9 +162,7 @@ async def verify_coin(
 ):
     """Verifies the state of a user's role denoting their coin, creates it if it doesn't exist."""
     # update coin for member who has cactus coin in database
-    member_coin: Amount = Amount.get_by_id(member.id)
-    db_amount = member_coin.coin
-    prefix = config.get_attribute("rolePrefix", "Cactus Coin: ")
+    db_amount = await db_executor.run(_load_or_init_coin, member.id, amount)
     if db_amount:
         amount = db_amount
         logging.debug(f"Found coin for {member.display_name}: {str(db_amount)}")
@@ -73,188 +170,301 @@ async def verify_coin(
         logging.debug(
             f"No coin found for {member.display_name}, defaulting to: {str(amount)}"
         )
-        member_coin.coin = amount
-        member_coin.save()
-
-    role_names = [role.name for role in member.roles if prefix in role.name]
-    if not role_names:
-        role = await create_role(guild, amount)
-        await member.add_roles(
-            role, reason=f"Cactus Coin: Role updated for {member.name} to {str(amount)}"
-        )
 
+    async with role_locks[member.id]:
+        latest = guild.get_member(member.id) or member
+        if not any(is_coin_role(role) for role in latest.roles):
+            await reconcile_roles(guild, member, amount)
 
-async def clear_old_roles(guild: discord.Guild):
+
+async def clear_old_roles(
+    guild: discord.Guild, limit: Optional[int] = None, idle_for: float = 0
+) -> Tuple[int, int]:
     """
-    Deletes all old cactus coin roles
+    Deletes cactus coin roles nobody holds anymore, tier roles are kept for reuse
     :param guild:
-    :return:
+    :param limit: most roles deleted in one call, the rest wait for the next one
+    :param idle_for: skips roles created or picked for a member this many seconds ago or less,
+        their role edits may still be waiting to run
+    :return: the number of coin roles scanned and the number deleted
+    """
+    scanned = role_index.role_count(guild)
+    deleted = 0
+    for role in role_index.empty_roles(guild, idle_for):
+        if limit is not None and deleted >= limit:
+            break
+        # someone may have been given or picked for the role while earlier deletes were awaited
+        if role_tiers.is_tier_role(role) or not role_index.is_idle(role, idle_for):
+            continue
+        await _role_request("delete", guild, lambda: role.delete(reason="Cactus Coin: Removing unused role."))
+        role_index.remove_role(role)
+        deleted += 1
+    role_sweeps["runs"] += 1
+    role_sweeps["scanned"] += scanned
+    role_sweeps["deleted"] += deleted
+    return scanned, deleted
+
+
+async def collapse_roles(guild: discord.Guild) -> int:
+    """
+    Deletes every cactus coin role that isn't a tier role, once members have been moved onto their tiers.
+    :param guild:
+    :return: the number of roles deleted
     """
-    empty_roles = [
-        role
-        for role in guild.roles
-        if config.get_attribute("rolePrefix", "Cactus Coin: ") in role.name
-        and len(role.members) == 0
-    ]
-    for role in empty_roles:
-        await role.delete(reason="Cactus Coin: Removing unused role.")
+    legacy = [role for role in guild.roles if is_coin_role(role) and not role_tiers.is_tier_role(role)]
+    for role in legacy:
+        await _role_request("delete", guild, lambda: role.delete(reason="Cactus Coin: Collapsing into tier roles."))
+    return len(legacy)
 
 
 async def update_role(guild: discord.Guild, member: discord.Member, amount: int):
     """
-    Deletes old role and calls function to update new role displaying coin amount
+    Swaps the member's coin role for the one displaying the new coin amount
     :param guild:
     :param member:
     :param amount:
     :return:
     """
-    await remove_role(guild, member)
-    role = await create_role(guild, amount)
-    await member.add_roles(
-        role, reason=f"Cactus Coin: Role updated for {member.name} to {str(amount)}"
-    )
+    await reconcile_roles(guild, member, amount)
+
+
+def _apply_coin(member_id: int, guild_id: int, amount: int, persist: bool, memo: Optional[str]) -> int:
+    """Adds coin to a member's stored wallet, respecting the debt limit, and returns the new amount"""
+    with group_commit.write():
+        current_coin = get_coin(member_id)
+        if current_coin is None:
+            current_coin = config.get_attribute("defaultCoin")
+        new_coin = max(current_coin + amount, config.get_attribute("debtLimit"))
+        update_coin(member_id, new_coin)
+        if persist:
+            ledger.record(member_id, amount, guild_id=guild_id, memo=memo)
+    return new_coin
 
 
 async def add_coin(
-    guild: discord.Guild, member: discord.Member, amount: int, persist: bool = True
+    guild: discord.Guild,
+    member: discord.Member,
+    amount: int,
+    persist: bool = True,
+    memo: Optional[str] = None,
 ):
     """
     Adds a specified coin amount to a member's role and stores in the database
     :param guild:
     :param member:
     :param amount:
-    :param persist:
+    :param persist: whether the change is recorded in the member's ledger
+    :param memo:
     :return:
     """
-    member_amount: Amount = Amount.get_by_id(member.id)
-    current_coin = member_amount.coin
-    new_coin = max(current_coin + amount, config.get_attribute("debtLimit"))
-    member_amount.coin = new_coin
-    member_amount.save()
-    if persist:
-        Transaction.insert(
-            coin=amount,
-            date=datetime.utcnow(),
-        )
-    await update_role(guild, member, new_coin)
+    async with member_locks[member.id]:
+        new_coin = await db_executor.run(_apply_coin, member.id, guild.id, amount, persist, memo)
+        role_scheduler.schedule(guild, member, new_coin)
 
 
-# Computes power rankings for the server and outputs them in a bar graph in an image
-async def compute_rankings(guild: discord.Guild):
-    rankings = get_coin_rankings()
-    await graph_amounts(guild, rankings)
-    today_date = datetime.today().astimezone(tz=timezone("US/Eastern"))
-    today = today_date.strftime("%m-%d-%Y")
-    plt.title("Cactus Gang Power Rankings\n" + today, fontweight="bold")
-    plt.xlabel("Coin (¢)")
-    if not os.path.exists(RANKINGS_FOLDER):
-        os.makedirs(RANKINGS_FOLDER)
-    image_path = f"{RANKINGS_FOLDER}/power-rankings-{today}.png"
-    plt.savefig(image_path, bbox_inches="tight", pad_inches=0.5)
-    plt.close()
-    return image_path
+async def _settled_balance(member_id: int) -> Optional[int]:
+    """
+    Reads a member's coin once any change in progress has finished. The coin lock is only held for the read,
+    role edits can wait behind the rate limits for a while and mustn't hold up /give or trivia rewards.
+    """
+    async with member_locks[member_id]:
+        return await get_balance(member_id)
+
+
+async def sync_role(guild: discord.Guild, member: discord.Member):
+    """Updates a member's coin role to whatever their coin is by the time the update runs"""
+    async with role_locks[member.id]:
+        coin = await _settled_balance(member.id)
+        if coin is not None:
+            await update_role(guild, member, coin)
+
+
+async def _apply_scheduled_role(guild: discord.Guild, member: discord.Member, amount: int):
+    """
+    Applies a debounced role update. The stored balance wins over the scheduled amount, in case a bulk job
+    changed the member's coin after the update was scheduled, and a cleared wallet means no coin role at all.
+    """
+    async with role_locks[member.id]:
+        coin = await _settled_balance(member.id)
+        await reconcile_roles(guild, member, coin)
+
 
+role_scheduler.apply = _apply_scheduled_role
 
-def remove_file(file_path: str):
+
+async def run_role_job(
+    members: List[discord.Member],
+    action: Callable[[discord.Member], Awaitable],
+    progress: Optional[Callable[[int, int], Awaitable]] = None,
+    batch_size: int = ROLE_JOB_BATCH_SIZE,
+):
     """
-    Removes a file if it exists
-    :param file_path:
+    Runs a role action for every member in batches, for bulk changes that are too slow to wait on.
+    Failures are logged and skipped so one member can't stop the job.
+    :param members:
+    :param action:
+    :param progress: called with (done, total) after each batch
+    :param batch_size:
     :return:
     """
-    if os.path.isfile(file_path):
-        os.remove(file_path)
-
-
-# Verify we have a member's icon
-async def get_icon(member: discord.Member):
-    # check if we already have the file in tmp folder, if not grab it and save it.
-    icon = member.display_avatar
-    stored_icons = os.listdir("../tmp")
-    if f"{icon.key}-44px.png" not in stored_icons:
-        img = Image.open(BytesIO(await icon.read())).convert("RGB")
-        img = img.resize((128, 128))
-        img.save(f"../tmp/{icon.key}.png", "PNG")
-        img.putalpha(icon_mask)
-        img = img.resize(ICON_SIZE)
-        img.save(f"../tmp/{icon.key}-44px.png", "PNG")
-        img.close()
-
-
-async def graph_amounts(guild: discord.Guild, data):
-    """Generic function for graphing a nice looking bar chart of values for each member
-    This function does not set plot title, axis titles, or close the plot"""
-    # pull all images of ranking members from Discord
-    member_icons, member_names, member_amounts, member_color = [], [], [], []
+    total = len(members)
+    for start in range(0, total, batch_size):
+        batch = members[start:start + batch_size]
+        results = await asyncio.gather(*(action(member) for member in batch), return_exceptions=True)
+        for member, result in zip(batch, results):
+            if isinstance(result, Exception):
+                logging.error(f"Role update failed for {member.display_name}: {result}")
+        if progress:
+            try:
+                await progress(min(start + batch_size, total), total)
+            except discord.HTTPException as e:
+                logging.debug(f"Couldn't report role job progress: {e}")
+
+
+async def transfer_coin(
+    guild: discord.Guild, sender: discord.Member, recipient: discord.Member, amount: int
+) -> Optional[int]:
+    """
+    Moves coin from one member to another in a single database transaction.
+    Both members are locked while the coin moves, their role updates are scheduled once it has.
+    :param guild:
+    :param sender:
+    :param recipient:
+    :param amount:
+    :return: the sender's new coin, or None if they don't have enough coin to give
+    """
+    first, second = sorted((sender.id, recipient.id))
+    async with member_locks[first], member_locks[second]:
+        amounts = await db_executor.run(
+            sql_client.transfer_coin,
+            sender.id,
+            recipient.id,
+            amount,
+            config.get_attribute("debtLimit"),
+            config.get_attribute("defaultCoin"),
+            guild.id,
+        )
+        if amounts is None:
+            return None
+        for member, new_coin in zip((sender, recipient), amounts):
+            role_scheduler.schedule(guild, member, new_coin)
+    return amounts[0]
+
 
-    for member_id, amount in data:
+def _rankings_key(guild: discord.Guild, version: int, rows, today: str):
+    """Everything drawn in a rankings chart, so a cached chart is only reused while it would look the same"""
+    members = []
+    for rank, member_id, _amount in rows:
         member = guild.get_member(member_id)
-        if not member:
-            return
-        await get_icon(member)
-
-        member_icons.append(f"../tmp/{member.display_avatar.key}-44px.png")
-        member_names.append(member.display_name)
-        member_amounts.append(amount)
-        # alternate bar color generation
-        # im = img.resize((1, 1), Image.NEAREST).convert('RGB')
-        # color = im.getpixel((0, 0))
-        # normalize pixel values between 0 and 1
-        memberC = (
-            member.color
-            if (
-                member.color != discord.Color.default()
-                or member.color != discord.Color.from_rgb(1, 1, 1)
-            )
-            else discord.Color.blurple()
+        members.append(
+            (rank, member_id, member.display_name, member.color.value, member.display_avatar.key) if member else None
         )
-        color = (memberC.r, memberC.g, memberC.b)
-        member_color.append(tuple(t / 255.0 for t in color))
-    ax = plt.axes()
-    ax.set_axisbelow(True)
-    ax.yaxis.grid(color=".9", linestyle="dashed")
-    ax.xaxis.grid(color=".9", linestyle="dashed")
-    lab_x = [i for i in range(len(data))]
-    height = 0.8
-    plt.barh(lab_x, member_amounts, height=height, color=member_color)
-    plt.yticks(lab_x, member_names)
-
-    # create a glowy effect on the plot by plotting different bars
-    n_shades = 5
-    diff_linewidth = 0.05
-    alpha_value = 0.5 / n_shades
-    for n in range(1, n_shades + 1):
-        plt.barh(
-            lab_x,
-            member_amounts,
-            height=(height + (diff_linewidth * n)),
-            alpha=alpha_value,
-            color=member_color,
+    return guild.id, version, today, tuple(members)
+
+
+# Computes power rankings for the server and outputs them in a bar graph as PNG bytes
+async def compute_rankings(guild: discord.Guild, mode: str = "top", count: Optional[int] = None, page: int = 1,
+                           member: Optional[discord.Member] = None) -> Optional[bytes]:
+    """
+    Draws one window of the guild's rankings, so the chart never has more than `count` bars
+    :param guild:
+    :param mode: top for the richest members, page for the page-th group of `count`, around for the members
+    ranked near `member`
+    :param count: members to show, defaults to the rankingsSize config
+    :param page:
+    :param member:
+    :return: PNG bytes, or None if nobody is ranked in the window
+    """
+    count = min(count or config.get_attribute("rankingsSize", 20), MAX_RANKINGS_SIZE)
+
+    # members who have left the guild stay in AMOUNTS, they are skipped with a member cache lookup
+    def in_guild(member_id: int) -> bool:
+        return guild.get_member(member_id) is not None
+
+    # read the version before the rankings, a change in between only makes the cached key look older
+    version = leaderboard.version
+    if mode == "around":
+        rows = leaderboard.around(member.id, count, in_guild)
+    elif mode == "page":
+        rows = leaderboard.page(count, (page - 1) * count, in_guild)
+    else:
+        rows = leaderboard.page(count, 0, in_guild)
+    if not rows:
+        return None
+    # lowest first, so the richest member is drawn at the top of the chart
+    rows.reverse()
+    today_date = datetime.today().astimezone(tz=timezone("US/Eastern"))
+    today = today_date.strftime("%m-%d-%Y")
+    key = _rankings_key(guild, version, rows, today)
+    image = rankings_cache.get(key)
+    if image is None:
+        chart = BarChart(title="Cactus Gang Power Rankings\n" + today, xlabel="Coin (¢)")
+        await graph_amounts(guild, rows, chart)
+        image = await renderer.render(chart)
+        rankings_cache.put(key, image)
+    return image
+
+
+def member_color(member: discord.Member) -> Tuple[float, float, float]:
+    """A member's role color for charts"""
+    # alternate bar color generation
+    # im = img.resize((1, 1), Image.NEAREST).convert('RGB')
+    # color = im.getpixel((0, 0))
+    # normalize pixel values between 0 and 1
+    memberC = (
+        member.color
+        if (
+            member.color != discord.Color.default()
+            or member.color != discord.Color.from_rgb(1, 1, 1)
         )
+        else discord.Color.blurple()
+    )
+    color = (memberC.r, memberC.g, memberC.b)
+    return tuple(t / 255.0 for t in color)
 
-    # add user icons to bar charts
-    max_value = max(member_amounts)
-    for i, (value, icon) in enumerate(zip(member_amounts, member_icons)):
-        offset_image(value, i, icon, max_value=max_value, ax=ax)
-
-
-def offset_image(x, y, icon, max_value, ax):
-    """Adds discord icons to bar chart"""
-    img = plt.imread(icon)
-    im = OffsetImage(img, zoom=0.65)
-    im.image.axes = ax
-    x_offset = -25
-    # if bar is too short to show icon
-    if 0 <= x < max_value / 5:
-        x = x + max_value // 8
-    elif x < max_value / 5:
-        x = 0
-    ab = AnnotationBbox(
-        im,
-        (x, y),
-        xybox=(x_offset, 0),
-        frameon=False,
-        xycoords="data",
-        boxcoords="offset points",
-        pad=0,
+
+async def compute_history(members: List[discord.Member], days: int) -> Optional[bytes]:
+    """
+    Draws the members' balances over the last `days` days from the daily balance rollup
+    :param members:
+    :param days:
+    :return: PNG bytes, or None if none of the members have a balance history
+    """
+    today = balance_history.today()
+    since = today - timedelta(days=days - 1)
+    history = await db_executor.run(balance_history.get_history, [member.id for member in members], since)
+    chart = LineChart(
+        title=f"Cactus Coin Balance History\n{since:%m-%d-%Y} to {today:%m-%d-%Y}", xlabel="Date", ylabel="Coin (¢)"
     )
-    ax.add_artist(ab)
+    for member in members:
+        points = history.get(member.id)
+        if not points:
+            continue
+        # each closing balance holds until the next day's, so carry the latest one to the end of today
+        points.append((today + timedelta(days=1), points[-1][1]))
+        chart.series.append(LineSeries(
+            member.display_name,
+            member_color(member),
+            [day for day, _balance in points],
+            [balance for _day, balance in points],
+        ))
+    if not chart.series:
+        return None
+    return await renderer.render(chart)
+
+
+async def graph_amounts(guild: discord.Guild, data, chart: BarChart):
+    """Generic function for filling a bar chart with a bar, name, color and icon for each (rank, member id, amount)
+    A rank of None leaves it out of the label. Members no longer in the guild are skipped.
+    This function does not set the chart title or axis titles"""
+    members = []
+    for rank, member_id, amount in data:
+        member = guild.get_member(member_id)
+        if not member:
+            continue
+        members.append(member)
+        chart.names.append(member.display_name if rank is None else f"#{rank} {member.display_name}")
+        chart.amounts.append(amount)
+        chart.colors.append(member_color(member))
+    # pull all images of ranking members from Discord
+    chart.icons.extend(await avatar_cache.get_many(members))
@@ -0,0 +1,436 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import date
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from src import config, stats
+
+# The bot's dark theme, applied per render instead of through global pyplot state
+STYLE = [
+    "dark_background",
+    {
+        "text.color": "0.9",  # very light grey
+        "axes.labelcolor": "0.9",
+        "xtick.color": "0.9",
+        "ytick.color": "0.9",
+        "figure.facecolor": "#212946",  # bluish dark grey
+        "axes.facecolor": "#212946",
+        "savefig.facecolor": "#212946",
+        "font.family": "Tahoma",
+        "font.size": 16,
+    },
+]
+
+
+@dataclass
+class BarChart:
+    """Plain data for one horizontal bar chart, so it can be pickled and drawn in a worker process"""
+    title: str
+    xlabel: str
+    names: List[str] = field(default_factory=list)
+    amounts: List[int] = field(default_factory=list)
+    # RGB between 0 and 1
+    colors: List[Tuple[float, float, float]] = field(default_factory=list)
+    # masked PNG avatar for each bar
+    icons: List[Optional[bytes]] = field(default_factory=list)
+
+
+def render_bar_chart(chart: BarChart) -> bytes:
+    """Draws a glowing horizontal bar chart with member icons and returns it as PNG bytes"""
+    import matplotlib.style
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    with matplotlib.style.context(STYLE):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_axisbelow(True)
+        ax.yaxis.grid(color=".9", linestyle="dashed")
+        ax.xaxis.grid(color=".9", linestyle="dashed")
+        lab_x = list(range(len(chart.amounts)))
+        height = 0.8
+        ax.barh(lab_x, chart.amounts, height=height, color=chart.colors)
+        ax.set_yticks(lab_x, chart.names)
+
+        # create a glowy effect on the plot by plotting different bars
+        n_shades = 5
+        diff_linewidth = 0.05
+        alpha_value = 0.5 / n_shades
+        for n in range(1, n_shades + 1):
+            ax.barh(
+                lab_x,
+                chart.amounts,
+                height=(height + (diff_linewidth * n)),
+                alpha=alpha_value,
+                color=chart.colors,
+            )
+
+        # add user icons to bar charts
+        if chart.amounts:
+            max_value = max(chart.amounts)
+            for i, (value, icon) in enumerate(zip(chart.amounts, chart.icons)):
+                if icon:
+                    _offset_image(value, i, icon, max_value=max_value, ax=ax)
+
+        ax.set_title(chart.title, fontweight="bold")
+        ax.set_xlabel(chart.xlabel)
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0.5)
+        return buffer.getvalue()
+
+
+def _offset_image(x, y, icon: bytes, max_value, ax):
+    """Adds discord icons to bar chart"""
+    from matplotlib.image import imread
+    from matplotlib.offsetbox import AnnotationBbox, OffsetImage
+
+    img = imread(BytesIO(icon), format="png")
+    im = OffsetImage(img, zoom=0.65)
+    im.image.axes = ax
+    x_offset = -25
+    # if bar is too short to show icon
+    if 0 <= x < max_value / 5:
+        x = x + max_value // 8
+    elif x < max_value / 5:
+        x = 0
+    ab = AnnotationBbox(
+        im,
+        (x, y),
+        xybox=(x_offset, 0),
+        frameon=False,
+        xycoords="data",
+        boxcoords="offset points",
+        pad=0,
+    )
+    ax.add_artist(ab)
+
+
+@dataclass
+class LineSeries:
+    """One member's balance line"""
+    name: str
+    # RGB between 0 and 1
+    color: Tuple[float, float, float]
+    days: List[date] = field(default_factory=list)
+    balances: List[int] = field(default_factory=list)
+
+
+@dataclass
+class LineChart:
+    """Plain data for a chart of balances over time, always drawn with matplotlib"""
+    title: str
+    xlabel: str
+    ylabel: str
+    series: List[LineSeries] = field(default_factory=list)
+
+
+def render_line_chart(chart: LineChart) -> bytes:
+    """Draws glowing step lines of balances over time and returns them as PNG bytes"""
+    import matplotlib.dates
+    import matplotlib.style
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    with matplotlib.style.context(STYLE):
+        fig = Figure(figsize=(10, 5))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_axisbelow(True)
+        ax.yaxis.grid(color=".9", linestyle="dashed")
+        ax.xaxis.grid(color=".9", linestyle="dashed")
+
+        # create a glowy effect on the plot by redrawing each line wider and fainter
+        n_shades = 5
+        diff_linewidth = 1.5
+        alpha_value = 0.5 / n_shades
+        for series in chart.series:
+            ax.step(series.days, series.balances, where="post", color=series.color, linewidth=2, label=series.name)
+            for n in range(1, n_shades + 1):
+                ax.step(
+                    series.days,
+                    series.balances,
+                    where="post",
+                    color=series.color,
+                    linewidth=2 + (diff_linewidth * n),
+                    alpha=alpha_value,
+                )
+
+        locator = matplotlib.dates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(matplotlib.dates.ConciseDateFormatter(locator))
+        if len(chart.series) > 1:
+            ax.legend(loc="upper left", fontsize="small", frameon=False)
+        ax.set_title(chart.title, fontweight="bold")
+        ax.set_xlabel(chart.xlabel)
+        ax.set_ylabel(chart.ylabel)
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0.5)
+        return buffer.getvalue()
+
+
+# Pillow backend colours and sizes, matching the matplotlib style at its default 100 dpi
+BACKGROUND = "#212946"
+TEXT_COLOR = (230, 230, 230)
+GRID_COLOR = (230, 230, 230, 90)
+FONT_SIZE = 22
+ROW_HEIGHT = 48
+PLOT_WIDTH = 800
+MARGIN = 50
+ICON_OFFSET = 35
+
+
+def _load_font(names: List[str], size: int):
+    from PIL import ImageFont
+
+    for name in names:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def _nice_ticks(low: float, high: float, count: int = 6) -> List[float]:
+    """Round tick values covering low to high, like matplotlib's default locator"""
+    if high <= low:
+        high = low + 1
+    raw_step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    first = math.ceil(low / step) * step
+    return [first + i * step for i in range(int((high - first) / step) + 1)]
+
+
+def _blend(color: Tuple[int, int, int], background: Tuple[int, int, int], alpha: float) -> Tuple[int, int, int]:
+    return tuple(round(c * alpha + b * (1 - alpha)) for c, b in zip(color, background))
+
+
+def render_bar_chart_pillow(chart: BarChart) -> bytes:
+    """
+    Draws the same glowing horizontal bar chart as render_bar_chart straight onto a Pillow image.
+    Translucent layers are blended up front and drawn opaque, so the whole chart is a handful of
+    rectangle fills instead of full-image compositing.
+    """
+    from PIL import Image, ImageDraw
+
+    font = _load_font(["Tahoma.ttf", "tahoma.ttf", "DejaVuSans.ttf"], FONT_SIZE)
+    title_font = _load_font(["Tahoma Bold.ttf", "tahomabd.ttf", "DejaVuSans-Bold.ttf"], FONT_SIZE)
+    measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+    def text_size(text, text_font):
+        left, top, right, bottom = measure.multiline_textbbox((0, 0), text, font=text_font, align="center")
+        return right - left, bottom - top
+
+    rows = len(chart.amounts)
+    low = min([0, *chart.amounts])
+    high = max([0, *chart.amounts]) or 1
+    ticks = _nice_ticks(low, high)
+    low, high = min(low, ticks[0]), max(high, ticks[-1])
+
+    names_width = max([text_size(name, font)[0] for name in chart.names] or [0])
+    title_width, title_height = text_size(chart.title, title_font)
+    _, label_height = text_size(chart.xlabel or "0", font)
+    plot_left = MARGIN + names_width + 10
+    plot_right = plot_left + PLOT_WIDTH
+    plot_top = MARGIN + title_height + 15
+    plot_bottom = plot_top + max(rows, 1) * ROW_HEIGHT
+    width = max(plot_right + MARGIN, title_width + 2 * MARGIN)
+    height = plot_bottom + 2 * label_height + 25 + MARGIN
+
+    img = Image.new("RGB", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    background = img.getpixel((0, 0))
+
+    def x_pos(value):
+        return plot_left + (value - low) * PLOT_WIDTH / (high - low)
+
+    def row_center(i):
+        # the first amount is drawn at the bottom, like matplotlib
+        return plot_bottom - (i + 0.5) * ROW_HEIGHT
+
+    # dashed grid behind the bars
+    grid = _blend(TEXT_COLOR, background, GRID_COLOR[3] / 255)
+    for tick in ticks:
+        x = x_pos(tick)
+        for y in range(plot_top, plot_bottom, 8):
+            draw.line([(x, y), (x, min(y + 4, plot_bottom))], fill=grid)
+    for i in range(rows):
+        y = row_center(i)
+        for x in range(plot_left, plot_right, 8):
+            draw.line([(x, y), (min(x + 4, plot_right), y)], fill=grid)
+
+    # create a glowy effect on the plot with wider translucent bars around each bar. Where n shades overlap
+    # the background they blend to a fixed colour, so each band is drawn once, widest and faintest first.
+    n_shades = 5
+    alpha_value = 0.5 / n_shades
+    bar_height = 0.8 * ROW_HEIGHT
+    zero = x_pos(0)
+    for i, amount in enumerate(chart.amounts):
+        color = tuple(round(255 * c) for c in chart.colors[i]) if i < len(chart.colors) else (88, 101, 242)
+        left, right = sorted((zero, x_pos(amount)))
+        y = row_center(i)
+        for n in range(n_shades, 0, -1):
+            half = (bar_height + 0.05 * ROW_HEIGHT * n) / 2
+            layers = n_shades - n + 1
+            shade = _blend(color, background, 1 - (1 - alpha_value) ** layers)
+            draw.rectangle([left, y - half, right, y + half], fill=shade)
+        # the glow over the bar itself is the bar's own colour
+        draw.rectangle([left, y - bar_height / 2, right, y + bar_height / 2], fill=color)
+
+    # add user icons to bar charts, each distinct icon is decoded once
+    icons = {}
+    max_value = max(chart.amounts) if chart.amounts else 0
+    for i, (value, icon) in enumerate(zip(chart.amounts, chart.icons)):
+        if not icon:
+            continue
+        if icon not in icons:
+            with Image.open(BytesIO(icon)) as icon_img:
+                icons[icon] = icon_img.convert("RGBA")
+        icon_img = icons[icon]
+        # if bar is too short to show icon
+        if 0 <= value < max_value / 5:
+            value = value + max_value // 8
+        elif value < max_value / 5:
+            value = 0
+        x = round(x_pos(value) - ICON_OFFSET - icon_img.width / 2)
+        y = round(row_center(i) - icon_img.height / 2)
+        img.paste(icon_img, (max(x, 0), max(y, 0)), icon_img)
+
+    for i, name in enumerate(chart.names):
+        draw.text((plot_left - 10, row_center(i)), name, font=font, fill=TEXT_COLOR, anchor="rm")
+    for tick in ticks:
+        draw.text((x_pos(tick), plot_bottom + 8), f"{tick:g}", font=font, fill=TEXT_COLOR, anchor="ma")
+    center = plot_left + PLOT_WIDTH / 2
+    draw.multiline_text((center, MARGIN), chart.title, font=title_font, fill=TEXT_COLOR, anchor="ma", align="center")
+    draw.text((center, plot_bottom + label_height + 20), chart.xlabel, font=font, fill=TEXT_COLOR, anchor="ma")
+
+    buffer = BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+BACKENDS = {"matplotlib": render_bar_chart, "pillow": render_bar_chart_pillow}
+
+
+class ChartRenderer:
+    """
+    Draws charts off the event loop. Matplotlib charts run in a small process pool so concurrent renders
+    can't draw into each other's figures; Pillow charts only touch their own image and run in threads.
+    """
+
+    def __init__(self, workers: int = 1, backend: str = "matplotlib") -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown chart backend {backend}, expected one of {', '.join(BACKENDS)}")
+        self.workers = workers
+        self.backend = backend
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self.renders = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.pool_restarts = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    def _get_pool(self, threaded: bool) -> Executor:
+        if threaded:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chart-render")
+            return self._thread_pool
+        if self._process_pool is None:
+            # spawn so workers don't inherit the bot's threads and open database connection
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    def _replace_broken_pool(self, broken: Executor) -> None:
+        """Drops a process pool whose worker died, the next render starts a fresh one"""
+        if self._process_pool is broken:
+            logging.warning("Chart render worker died, restarting the render pool")
+            self._process_pool = None
+            self.pool_restarts += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, chart: Union[BarChart, LineChart]) -> Tuple[Executor, Future]:
+        if isinstance(chart, LineChart):
+            # matplotlib styles are global state, so matplotlib charts always get a process to themselves
+            pool = self._get_pool(threaded=False)
+            return pool, pool.submit(render_line_chart, chart)
+        pool = self._get_pool(threaded=self.backend == "pillow")
+        return pool, pool.submit(BACKENDS[self.backend], chart)
+
+    async def render(self, chart: Union[BarChart, LineChart], timeout: Optional[float] = None) -> bytes:
+        """
+        Renders a chart with the configured backend. Cancelling the caller, or passing the timeout,
+        drops renders that haven't started yet; a render already being drawn finishes in its worker and is thrown away.
+        :param chart:
+        :param timeout: seconds to wait before giving up
+        :return: PNG bytes
+        """
+        started = time.perf_counter()
+        # a killed worker breaks its pool for good, so the pool is replaced and the render tried once more
+        for attempt in range(2):
+            pool, future = None, None
+            remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - started))
+            try:
+                pool, future = self._submit(chart)
+                image = await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+                break
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                if future is not None:
+                    future.cancel()
+                self.cancelled += 1
+                raise
+            except BrokenProcessPool:
+                self._replace_broken_pool(pool if pool is not None else self._process_pool)
+                if attempt == 0:
+                    continue
+                self.failed += 1
+                logging.exception("Chart render failed")
+                raise
+            except Exception:
+                self.failed += 1
+                logging.exception("Chart render failed")
+                raise
+        latency = time.perf_counter() - started
+        self.renders += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        return image
+
+    def shutdown(self) -> None:
+        for pool in (self._process_pool, self._thread_pool):
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self._process_pool = None
+        self._thread_pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "renders": self.renders,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "pool_restarts": self.pool_restarts,
+            "avg_ms": round(1000 * self.total_latency / self.renders) if self.renders else 0,
+            "last_ms": round(1000 * self.last_latency),
+            "max_ms": round(1000 * self.max_latency),
+        }
+
+
+renderer = ChartRenderer(
+    config.get_attribute("renderWorkers", 1), config.get_attribute("rankingsBackend", "matplotlib")
+)
+stats.register("renderer", renderer.get_stats)
@@ -6,7 +6,7 @@ from discord.ext import commands, tasks
 from pytz import timezone
 
 
-from src import permissions
+from src import action_queue, db_executor, permissions
 from src.cogs.main_cog import adminCommands
 from src.models import Game, ChallengeChannel, database
 
@@ -34,7 +34,7 @@ class ChallengesCog(commands.Cog):
     @discord.app_commands.check(permissions.is_admin)
     @discord.app_commands.guild_only()
     async def challenges_start(self, interaction: discord.Interaction) -> None:
-        _game_channel, created = ChallengeChannel.get_or_create(id=interaction.channel_id)
+        _game_channel, created = await db_executor.run(ChallengeChannel.get_or_create, id=interaction.channel_id)
         assert interaction.channel is not None
         await interaction.response.send_message(
             f"{interaction.channel.name} {'already' if created else ''} enabled for CG Challenges."
@@ -47,7 +47,9 @@ class ChallengesCog(commands.Cog):
     @discord.app_commands.guild_only()
     async def challenges_end(self, interaction: discord.Interaction) -> None:
         assert interaction.channel is not None
-        channels_removed = ChallengeChannel.delete().where(ChallengeChannel.id == interaction.channel_id)
+        channels_removed = await db_executor.run(
+            ChallengeChannel.delete().where(ChallengeChannel.id == interaction.channel_id).execute
+        )
         if channels_removed:
             await interaction.response.send_message(f"{interaction.channel.name} disabled for CG Challenges.")
         else:
@@ -63,8 +65,8 @@ class ChallengesCog(commands.Cog):
     @discord.app_commands.guild_only()
     async def add_challenge(self, interaction: discord.Interaction, game: str) -> None:
         assert interaction.channel is not None
-        Game.insert(name=game).execute()
-        game_entries: List[Game] = Game.select()
+        await db_executor.run(Game.insert(name=game).execute)
+        game_entries: List[Game] = await db_executor.run(lambda: list(Game.select()))
         string_of_games = ""
         game_entry: Game
         for game_entry in game_entries:
@@ -88,20 +90,22 @@ class ChallengesCog(commands.Cog):
         # check if this month is an odd month or today is not the scheduled alert or game day
         if today.month % 2 != 0 or not (alert_date == today or game_date == today):
             return
-        channel_id = ChallengeChannel.get()
+        channel_id = (await db_executor.run(ChallengeChannel.get)).id
         channel = await self.bot.fetch_channel(channel_id)
         # send a message alerting people about the game
         if alert_date == today:     
             try:
                 # pull a random game from the DB, send alert message, and delete game
-                unused_game = Game.select().order_by(database.random()).limit(1)[0]
-                await channel.send(content=f"This month's Cactus Coin challenge game will be {unused_game['name']}!" +
-                                f" Please react with the times you'll be free on {game_date.strftime('%A, %B %d')}."
-                                )
-                Game.delete().where(Game.id == unused_game['id']).execute()
+                unused_game = await db_executor.run(lambda: Game.select().order_by(database.random()).limit(1)[0])
+                await action_queue.send(
+                    channel,
+                    content=f"This month's Cactus Coin challenge game will be {unused_game['name']}!" +
+                    f" Please react with the times you'll be free on {game_date.strftime('%A, %B %d')}."
+                )
+                await db_executor.run(Game.delete().where(Game.id == unused_game['id']).execute)
             except Exception:
-                await channel.send(content="Bot couldn't fetch a game to play, pls elp.")
+                await action_queue.send(channel, content="Bot couldn't fetch a game to play, pls elp.")
             
         # send a reminder message that the game session is today
         elif game_date == today:
-            channel.send(content="Reminder: Today is the challenge day, be in the Discord at the time with the most votes.")
\ No newline at end of file
+            await action_queue.send(channel, content="Reminder: Today is the challenge day, be in the Discord at the time with the most votes.")
\ No newline at end of file
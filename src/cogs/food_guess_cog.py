@@ -6,7 +6,7 @@ from discord.ext import commands, tasks
 from pytz import timezone
 
 
-from src import permissions
+from src import db_executor, permissions
 from src.api_handlers.food_handler import generate_food_questions
 from src.cogs.main_cog import adminCommands
 from src.models import CountryAnswer, Food, FoodChannel
@@ -40,7 +40,7 @@ class FoodGuessCog(commands.Cog):
     @discord.app_commands.check(permissions.is_admin)
     @discord.app_commands.guild_only()
     async def frivia_start(self, interaction: discord.Interaction) -> None:
-        food_channel, created = FoodChannel.get_or_create(id=interaction.channel_id)
+        food_channel, created = await db_executor.run(FoodChannel.get_or_create, id=interaction.channel_id)
         assert interaction.channel is not None
         await interaction.response.send_message(
             f"{interaction.channel.name} {'already' if created else ''} enabled for food trivia."
@@ -53,7 +53,9 @@ class FoodGuessCog(commands.Cog):
     @discord.app_commands.guild_only()
     async def frivia_end(self, interaction: discord.Interaction) -> None:
         assert interaction.channel is not None
-        channels_removed = FoodChannel.delete().where(FoodChannel.id == interaction.channel_id)
+        channels_removed = await db_executor.run(
+            FoodChannel.delete().where(FoodChannel.id == interaction.channel_id).execute
+        )
         if channels_removed:
             await interaction.response.send_message(f"{interaction.channel.name} disabled for food trivia.")
         else:
@@ -75,15 +77,15 @@ class FoodGuessCog(commands.Cog):
     async def food_loop(
         self, send_question: bool = True, show_answer: bool = True
     ) -> None:
-        channel_id = FoodChannel.get()
+        channel_id = (await db_executor.run(FoodChannel.get)).id
         channel = await self.bot.fetch_channel(channel_id)
         await self.solve_question()
         # pull a new unused food and answers from the database
-        unused_food = Food.get_or_none(Food.used is False)
+        unused_food = await db_executor.run(Food.get_or_none, Food.used is False)
         # if there is not one, pull new questions and retry. If that fails, print a message to the channel
         if unused_food is None:
-            generate_food_questions()
-        unused_food = Food.get_or_none(Food.used is False)
+            await generate_food_questions()
+        unused_food = await db_executor.run(Food.get_or_none, Food.used is False)
         if unused_food is None:
             await channel.send(content="Bot couldn't fetch a question to ask, pls elp.")
             return
@@ -92,4 +94,4 @@ class FoodGuessCog(commands.Cog):
 
         # after it is sent, mark the food item as used
         unused_food.used = True
-        unused_food.save()
\ No newline at end of file
+        await db_executor.run(unused_food.save)
\ No newline at end of file
@@ -1,8 +1,13 @@
+from io import BytesIO
+import logging
+from typing import Literal, Optional
+
 import discord
-from discord.ext import commands
-from peewee import DoesNotExist
-from src import bot_helper, config, permissions, sql_client
-from src.models import Amount
+from discord.ext import commands, tasks
+from src import bot_helper, config, db_executor, ledger, permissions, role_tiers, sql_client, stats
+from src.avatar_cache import avatar_cache
+from src.leaderboard import leaderboard
+from src.role_index import is_coin_role, role_index
 
 userCommands = {
     "/help": "Outputs a list of commands.",
@@ -10,6 +15,8 @@ userCommands = {
     "/balance": "Displays a user's coin balance.",
     "/rankings": "Outputs power rankings for the server.",
     "/give": "Gives coin to a specific user, no strings attached.",
+    "/transactions": "Displays a user's most recent transactions.",
+    "/history": "Charts a user's, or the richest members', balance over time.",
 }
 
 adminCommands = {
@@ -19,6 +26,8 @@ adminCommands = {
     "/reset": "!ADMIN ONLY! Resets a user's wallet to the default starting amount",
     "/soft-reset": "!ADMIN ONLY! Resets all users's wallets to the default starting amount",
     "/full-clear": "!DEV ONLY! Clears all users's coins and clears all roles",
+    "/collapse-roles": "!ADMIN ONLY! Moves everyone onto tier roles and deletes the per-amount coin roles",
+    "/stats": "!DEV ONLY! Outputs internal performance statistics",
     "/challenges-start": "!ADMIN ONLY! Enables challenges for the channel",
     "/challenges-end": "!ADMIN ONLY! Disables challenges for the channel",
     "/add-challenge": "!ADMIN ONLY! Add a challenge to the list of possible challenges",
@@ -44,6 +53,64 @@ class BotCog(commands.Cog):
     async def on_ready(self) -> None:
         print(f"Logged in as {self.bot.user} (ID: {self.bot.user.id})")
         print("------")
+        for guild in self.bot.guilds:
+            role_index.build(guild)
+        # fetch the icons of the richest members so the first /rankings doesn't wait on downloads
+        members = []
+        for guild in self.bot.guilds:
+            top = leaderboard.page(
+                config.get_attribute("rankingsSize", 20),
+                include=lambda member_id: guild.get_member(member_id) is not None,
+            )
+            members.extend(guild.get_member(member_id) for _rank, member_id, _coin in top)
+        bot_helper.run_in_background(avatar_cache.prewarm(members), name="avatar-prewarm")
+        if not self.role_sweep.is_running():
+            self.role_sweep.start()
+
+    async def cog_unload(self):
+        self.role_sweep.cancel()
+
+    @tasks.loop(seconds=config.get_attribute("roleSweepIntervalSeconds", 300))
+    async def role_sweep(self) -> None:
+        # deletes coin roles nobody holds anymore, so commands never wait on role deletes
+        for guild in self.bot.guilds:
+            try:
+                # roles used since the last sweep may have edits still queued or scheduled
+                scanned, deleted = await bot_helper.clear_old_roles(
+                    guild,
+                    config.get_attribute("roleSweepBatchSize", 25),
+                    self.role_sweep.seconds,
+                )
+            except Exception:
+                # one bad guild shouldn't stop the loop for good
+                logging.exception(f"Role sweep failed for {guild.name}")
+                continue
+            if deleted:
+                logging.info(f"Role sweep for {guild.name}: {scanned} coin roles scanned, {deleted} deleted")
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild) -> None:
+        role_index.build(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role) -> None:
+        role_index.on_role_create(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        role_index.on_role_delete(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        role_index.on_role_update(before, after)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        role_index.on_member_update(before, after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member) -> None:
+        role_index.on_member_remove(member)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
@@ -90,28 +157,60 @@ class BotCog(commands.Cog):
     async def balance(
         self, interaction: discord.Interaction, user: discord.Member
     ) -> None:
-        try:
-            balance = Amount.get_by_id(user.id).coin
-            await interaction.response.send_message(
-                f"{user.display_name}'s balance: {str(balance)}.", ephemeral=True
-            )
-        except DoesNotExist:
+        balance = await bot_helper.get_balance(user.id)
+        if balance is None:
             await interaction.response.send_message(
                 f"{user.display_name}'s has no balance.", ephemeral=True
             )
+            return
+        # ranked among this server's members, like /rankings
+        guild = interaction.guild
+        rank = next(
+            (
+                rank
+                for rank, member_id, _coin in leaderboard.ranked(
+                    include=lambda member_id: guild.get_member(member_id) is not None
+                )
+                if member_id == user.id
+            ),
+            None,
+        )
+        rank_str = f" (rank #{rank})" if rank else ""
+        await interaction.response.send_message(
+            f"{user.display_name}'s balance: {str(balance)}{rank_str}.", ephemeral=True
+        )
 
     @discord.app_commands.command(
         name="rankings", description=userCommands["/rankings"]
     )
+    @discord.app_commands.describe(
+        mode="top shows the richest members, page flips through everyone, around shows the members near a user"
+    )
+    @discord.app_commands.describe(count="How many members to show")
+    @discord.app_commands.describe(page="The page to show in page mode")
+    @discord.app_commands.describe(user="The user to center on in around mode, yourself by default")
     @discord.app_commands.guild_only()
-    async def rankings(self, interaction: discord.Interaction) -> None:
+    async def rankings(
+        self,
+        interaction: discord.Interaction,
+        mode: Literal["top", "page", "around"] = "top",
+        count: Optional[discord.app_commands.Range[int, 1, bot_helper.MAX_RANKINGS_SIZE]] = None,
+        page: discord.app_commands.Range[int, 1] = 1,
+        user: Optional[discord.Member] = None,
+    ) -> None:
         await interaction.response.defer(ephemeral=False, thinking=True)
-        file_path = await bot_helper.compute_rankings(interaction.guild)
-        file = discord.File(file_path)
+        image = await bot_helper.compute_rankings(
+            interaction.guild, mode, count, page, user or interaction.user
+        )
+        if image is None:
+            await interaction.followup.send(
+                "No one is ranked there yet.", ephemeral=True
+            )
+            return
+        file = discord.File(BytesIO(image), filename="power-rankings.png")
         await interaction.followup.send(
             "Here are the current power rankings:", file=file
         )
-        bot_helper.remove_file(file_path)
 
     @discord.app_commands.command(name="give", description=userCommands["/give"])
     @discord.app_commands.describe(user="The user to give Cactus Coin to")
@@ -120,26 +219,80 @@ class BotCog(commands.Cog):
     async def give(
         self, interaction: discord.Interaction, user: discord.Member, amount: int
     ) -> None:
-        author_coin = Amount.get_by_id(user.id).coin
-        if author_coin - amount < config.get_attribute("debtLimit"):
+        if user.id == interaction.user.id:
             await interaction.response.send_message(
-                f'You don\'t have this much coin to give {config.get_attribute("sadEmote", "")}',
-                ephemeral=True,
+                "Are you stupid or something?", ephemeral=True
             )
-        elif user.id == interaction.user.id:
+            return
+        if amount <= 0:
             await interaction.response.send_message(
-                "Are you stupid or something?", ephemeral=True
+                "Nice try <:shanechamp:910353567603384340>", ephemeral=True
             )
-        elif amount > 0:
-            await bot_helper.add_coin(interaction.guild, user, amount)
-            await bot_helper.add_coin(interaction.guild, interaction.user, -amount)
+            return
+        author_coin = await bot_helper.transfer_coin(
+            interaction.guild, interaction.user, user, amount
+        )
+        if author_coin is None:
+            await interaction.response.send_message(
+                f'You don\'t have this much coin to give {config.get_attribute("sadEmote", "")}',
+                ephemeral=True,
+            )
+        else:
             await interaction.response.send_message(
                 f'{format(amount, ",d")} coin sent to {user.mention}'
             )
-        elif amount < 0:
+
+    @discord.app_commands.command(
+        name="transactions", description=userCommands["/transactions"]
+    )
+    @discord.app_commands.describe(user="The user to see the transactions for")
+    @discord.app_commands.guild_only()
+    async def transactions(
+        self, interaction: discord.Interaction, user: discord.Member
+    ) -> None:
+        history = await db_executor.run(ledger.get_history, user.id)
+        if not history:
             await interaction.response.send_message(
-                "Nice try <:shanechamp:910353567603384340>", ephemeral=True
+                f"{user.display_name} has no transactions.", ephemeral=True
             )
+            return
+        description = "\n".join(
+            f'{entry.date.strftime("%m-%d-%Y")}: {format(entry.coin, "+,d")}'
+            + (f" ({entry.memo})" if entry.memo else "")
+            for entry in history
+        )
+        embed = discord.Embed(
+            title=f"{user.display_name}'s Transactions",
+            description=description,
+            color=discord.Color.dark_gold(),
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @discord.app_commands.command(name="history", description=userCommands["/history"])
+    @discord.app_commands.describe(user="The user to chart, yourself by default")
+    @discord.app_commands.describe(top="Chart this many of the richest members instead of one user")
+    @discord.app_commands.describe(days="How many days back to chart")
+    @discord.app_commands.guild_only()
+    async def history(
+        self,
+        interaction: discord.Interaction,
+        user: Optional[discord.Member] = None,
+        top: Optional[discord.app_commands.Range[int, 1, bot_helper.MAX_HISTORY_MEMBERS]] = None,
+        days: discord.app_commands.Range[int, 1, 365] = 30,
+    ) -> None:
+        await interaction.response.defer(ephemeral=False, thinking=True)
+        guild = interaction.guild
+        if top:
+            ranked = leaderboard.page(top, include=lambda member_id: guild.get_member(member_id) is not None)
+            members = [guild.get_member(member_id) for _rank, member_id, _coin in ranked]
+        else:
+            members = [user or interaction.user]
+        image = await bot_helper.compute_history(members, days)
+        if image is None:
+            await interaction.followup.send("There's no balance history to show yet.", ephemeral=True)
+            return
+        file = discord.File(BytesIO(image), filename="balance-history.png")
+        await interaction.followup.send(file=file)
 
     """
     ADMIN COMMANDS
@@ -177,7 +330,9 @@ class BotCog(commands.Cog):
         amount: int,
         persist: bool,
     ) -> None:
-        await bot_helper.add_coin(interaction.guild, user, amount, persist=persist)
+        await bot_helper.add_coin(
+            interaction.guild, user, amount, persist=persist, memo="Admin adjustment"
+        )
         await interaction.response.send_message(
             f'Added {format(amount, ",d")} to {user.display_name}', ephemeral=True
         )
@@ -189,7 +344,7 @@ class BotCog(commands.Cog):
     async def clear(
         self, interaction: discord.Interaction, user: discord.Member
     ) -> None:
-        sql_client.remove_coin(user.id)
+        await db_executor.run(sql_client.remove_coin, user.id, durable=True)
         await bot_helper.remove_role(interaction.guild, user)
         await interaction.response.send_message(
             f"{user.display_name}'s coin has been cleared.", ephemeral=True
@@ -202,7 +357,7 @@ class BotCog(commands.Cog):
     async def reset(
         self, interaction: discord.Interaction, user: discord.Member
     ) -> None:
-        amount = sql_client.get_coin(user.id)
+        amount = await db_executor.run(sql_client.get_coin, user.id)
         await bot_helper.add_coin(
             interaction.guild,
             user,
@@ -220,21 +375,26 @@ class BotCog(commands.Cog):
     @discord.app_commands.guild_only()
     async def soft_reset(self, interaction: discord.Interaction) -> None:
         # BE CAREFUL WITH THIS IT WILL CLEAR OUT ALL COIN
-        output = ""
-        for member in interaction.guild.members:
-            amount = sql_client.get_coin(member.id)
-            await bot_helper.add_coin(
-                interaction.guild,
-                member,
-                -(amount - config.get_attribute("defaultCoin")),
-                persist=False,
-            )
-            await bot_helper.update_role(
-                interaction.guild, member, config.get_attribute("defaultCoin")
+        await interaction.response.defer(thinking=True)
+        guild = interaction.guild
+        default_coin = config.get_attribute("defaultCoin")
+        reset_ids = await db_executor.run(
+            sql_client.reset_coin, [member.id for member in guild.members], default_coin
+        )
+        members = [guild.get_member(member_id) for member_id in reset_ids]
+        summary = f"Everyone's coin reset back to {default_coin}."
+        await interaction.followup.send(f"{summary} Updating roles...")
+
+        async def progress(done: int, total: int):
+            await interaction.edit_original_response(
+                content=f"{summary} Roles updated: {done}/{total}"
             )
-        await interaction.response.send_message(
-            f'Everyone\'s coin reset back to {config.get_attribute("defaultCoin")}...here\'s the short history just in '
-            f"case.\n{output}"
+
+        bot_helper.run_in_background(
+            bot_helper.run_role_job(
+                members, lambda member: bot_helper.sync_role(guild, member), progress
+            ),
+            name="soft-reset-roles",
         )
 
     @discord.app_commands.command(
@@ -244,16 +404,86 @@ class BotCog(commands.Cog):
     @discord.app_commands.guild_only()
     async def full_clear(self, interaction: discord.Interaction) -> None:
         # BE CAREFUL WITH THIS IT WILL CLEAR OUT ALL COIN
-        output = ""
-        for member in interaction.guild.members:
-            coin = sql_client.get_coin(member.id)
-            sql_client.remove_coin(member.id)
-            sql_client.remove_transactions(member.id)
-            await bot_helper.remove_role(interaction.guild, member)
-            output += f"{member.display_name} - {str(coin)}\n"
-        await interaction.response.send_message(
-            "Everything cleared out...here's the short history just in case.\n" + output
+        await interaction.response.defer(thinking=True)
+        guild = interaction.guild
+        cleared = await db_executor.run(
+            sql_client.clear_coin, [member.id for member in guild.members]
+        )
+        output = "".join(
+            f"{guild.get_member(member_id).display_name} - {str(coin)}\n"
+            for member_id, coin in cleared
         )
+        summary = "Everything cleared out...here's the short history just in case."
+        # long histories go in an attachment, messages are capped at 2000 characters
+        history = discord.File(BytesIO(output.encode()), filename="history.txt")
+        await interaction.followup.send(f"{summary} Removing roles...", file=history)
+        members = [
+            member
+            for member in guild.members
+            if any(is_coin_role(role) for role in member.roles)
+        ]
+
+        async def progress(done: int, total: int):
+            await interaction.edit_original_response(
+                content=f"{summary} Roles removed: {done}/{total}"
+            )
+
+        bot_helper.run_in_background(
+            bot_helper.run_role_job(
+                members, lambda member: bot_helper.remove_role(guild, member), progress
+            ),
+            name="full-clear-roles",
+        )
+
+    @discord.app_commands.command(
+        name="collapse-roles", description=adminCommands["/collapse-roles"]
+    )
+    @discord.app_commands.check(permissions.is_admin)
+    @discord.app_commands.guild_only()
+    async def collapse_roles(self, interaction: discord.Interaction) -> None:
+        if not role_tiers.enabled():
+            await interaction.response.send_message(
+                "Tier roles are off, set roleTiers in the config first.", ephemeral=True
+            )
+            return
+        await interaction.response.defer(thinking=True)
+        guild = interaction.guild
+        members = [
+            member
+            for member in guild.members
+            if leaderboard.get_coin(member.id) is not None
+            or any(is_coin_role(role) for role in member.roles)
+        ]
+        summary = "Collapsing coin roles into tiers."
+        await interaction.followup.send(f"{summary} Moving members...")
+
+        async def progress(done: int, total: int):
+            await interaction.edit_original_response(
+                content=f"{summary} Members moved: {done}/{total}"
+            )
+
+        async def collapse():
+            await bot_helper.run_role_job(
+                members, lambda member: bot_helper.sync_role(guild, member), progress
+            )
+            deleted = await bot_helper.collapse_roles(guild)
+            await interaction.edit_original_response(
+                content=f"{summary} Members moved: {len(members)}, old roles deleted: {deleted}"
+            )
+
+        bot_helper.run_in_background(collapse(), name="collapse-roles")
+
+    @discord.app_commands.command(name="stats", description=adminCommands["/stats"])
+    @discord.app_commands.check(permissions.is_dev)
+    @discord.app_commands.guild_only()
+    async def show_stats(self, interaction: discord.Interaction) -> None:
+        embed = discord.Embed(
+            title="Cactus Coin Bot Statistics", color=discord.Color.dark_green()
+        )
+        for section, values in stats.collect().items():
+            lines = "\n".join(f"{key}: {value}" for key, value in values.items())
+            embed.add_field(name=section, value=lines or "\u200b", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @admin_help.error
     @admin_adjust.error
@@ -262,6 +492,8 @@ class BotCog(commands.Cog):
     @reset.error
     @soft_reset.error
     @full_clear.error
+    @collapse_roles.error
+    @show_stats.error
     async def permissions_error(self, interaction: discord.Interaction, error):
         if isinstance(error, discord.app_commands.errors.CheckFailure):
             await interaction.response.send_message(
@@ -1,14 +1,16 @@
 # This is pretty much deprecated for now, but keeping it around for reference or in case I want to bring it back
+import asyncio
 import datetime
-from typing import Optional
+import logging
+from typing import Optional, Set
 import discord
 from discord import NotFound
 from discord.ext import commands, tasks
 from pytz import timezone
 
-from src import permissions, sql_client, views
+from src import action_queue, bot_helper, config, db_executor, permissions, sql_client, views
 from src.cogs.main_cog import adminCommands
-from src.api_handlers.trivia_handler import Question, get_trivia_questions, Difficulty
+from src.api_handlers.trivia_handler import Question, get_trivia_questions, Difficulty, trivia_client
 
 
 # Daily trivia at 12AM EST
@@ -29,49 +31,83 @@ class TriviaCog(commands.Cog):
         self.current_index: int = 0
         self.trivia_category: Optional[str] = None
         self.trivia_difficulty: Optional[Difficulty] = None
+        # digests of every question asked so far, loaded once and kept in step with TRIVIA_HASHES
+        self.seen_questions: Optional[Set[int]] = None
+        # the pool is topped up in the background once it drops below this many questions
+        self.low_watermark: int = config.get_attribute("triviaLowWatermark", 10)
+        self.prefetch_task: Optional[asyncio.Task] = None
+        # held while the pool is refilled, so a top up and a repopulation never interleave
+        self.refill_lock = asyncio.Lock()
 
     @commands.Cog.listener()
     async def on_ready(self) -> None:
         print("Bot logged in and enabled for Trivia")
         print("------")
-        self.populate_question_list()
+        self.prefetch()
         self.trivia_loop.start()
 
     async def cog_unload(self):
         self.trivia_loop.cancel()
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+        await trivia_client.close()
 
-    def populate_question_list(self) -> bool:
+    async def populate_question_list(self, replace: bool = True) -> bool:
         """
         Repopulates the list of questions
+        :param replace: False adds the new questions to the ones already waiting instead
         :returns boolean: False if we have no new questions, true otherwise
         """
-        questions = get_trivia_questions(
-            str(self.question_amount), self.trivia_category, self.trivia_difficulty
-        )
-        # ensures no duplicates are in the question list
-        question_hashes = [tuple((hash(question),)) for question in questions]
-        seen_hash_result = sql_client.get_seen_questions()
-        seen_hashes = []
-        if seen_hash_result:
-            seen_hashes = [q[0] for q in seen_hash_result]
-        questions = [
-            question
-            for idx, question in enumerate(questions)
-            if question_hashes[idx][0] not in seen_hashes
-        ]
-        if questions:
-            self.questions = questions
-            return True
-        return False
-
-    def get_question(self, idx: int = 0) -> Question:
-        """Gets a question from the question list and repopulates the list if we run out of questions"""
-        # if we've run out of questions
+        async with self.refill_lock:
+            questions = await get_trivia_questions(
+                str(self.question_amount), self.trivia_category, self.trivia_difficulty
+            )
+            # ensures no duplicates are in the question list
+            if self.seen_questions is None:
+                self.seen_questions = await db_executor.run(sql_client.get_seen_questions)
+            pooled = set() if replace else {question.digest() for question in self.questions}
+            questions = [
+                question
+                for question in questions
+                if question.digest() not in self.seen_questions and question.digest() not in pooled
+            ]
+            if questions:
+                self.questions = questions if replace else self.questions + questions
+                return True
+            return False
+
+    def prefetch(self) -> Optional[asyncio.Task]:
+        """Tops up the question pool in the background when it is running low, returns the running top up if any"""
+        if self.prefetch_task is None or self.prefetch_task.done():
+            if len(self.questions) >= self.low_watermark:
+                return None
+            self.prefetch_task = bot_helper.run_in_background(
+                self.populate_question_list(replace=False), name="trivia-prefetch"
+            )
+        return self.prefetch_task
+
+    async def get_question(self, idx: int = 0) -> Optional[Question]:
+        """
+        Gets a question from the prefetched pool, only waiting on the API if prefetching couldn't keep up
+        :returns: the question, or None if the pool is empty and no more questions could be fetched
+        """
         if len(self.questions) == 0:
-            self.populate_question_list()
+            task = self.prefetch()
+            if task is not None:
+                try:
+                    await asyncio.shield(task)
+                except Exception:
+                    # already logged by the background task
+                    pass
+        if len(self.questions) <= idx:
+            return None
         curr_question = self.questions.pop(idx)
+        self.prefetch()
         # adds question to table of seen questions to avoid duplicates
-        sql_client.add_seen_question(hash(curr_question))
+        digest = curr_question.digest()
+        if self.seen_questions is not None:
+            self.seen_questions.add(digest)
+        await db_executor.run(sql_client.add_seen_question, digest)
         return curr_question
 
     @discord.app_commands.command(
@@ -90,7 +126,7 @@ class TriviaCog(commands.Cog):
     @discord.app_commands.check(permissions.is_admin)
     @discord.app_commands.guild_only()
     async def trivia_start(self, interaction: discord.Interaction) -> None:
-        sql_client.add_channel(interaction.channel_id)
+        await db_executor.run(sql_client.add_channel, interaction.channel_id)
         await interaction.response.send_message(
             f"{interaction.channel.name} enabled for trivia questions."
         )
@@ -101,7 +137,7 @@ class TriviaCog(commands.Cog):
     @discord.app_commands.check(permissions.is_admin)
     @discord.app_commands.guild_only()
     async def trivia_end(self, interaction: discord.Interaction) -> None:
-        sql_client.remove_channel(interaction.channel_id)
+        await db_executor.run(sql_client.remove_channel, interaction.channel_id)
         await interaction.response.send_message(
             f"{interaction.channel.name} disabled for trivia questions."
         )
@@ -112,9 +148,15 @@ class TriviaCog(commands.Cog):
     @discord.app_commands.check(permissions.is_admin)
     @discord.app_commands.guild_only()
     async def trivia_populate(self, interaction: discord.Interaction) -> None:
-        result = self.populate_question_list()
+        # fetching can take a while when OpenTDB rate limits us, longer than an interaction stays open
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            result = await self.populate_question_list()
+        except Exception:
+            logging.exception("Trivia question re-population failed")
+            result = False
         result_str = "successful" if result else "not successful"
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"The re-population of the trivia question base was {result_str}",
             ephemeral=True,
         )
@@ -128,7 +170,7 @@ class TriviaCog(commands.Cog):
     async def trivia_reward(
         self, interaction: discord.Interaction, reward: int
     ) -> None:
-        sql_client.update_reward(interaction.channel_id, reward)
+        await db_executor.run(sql_client.update_reward, interaction.channel_id, reward)
         await interaction.response.send_message(
             f"The trivia reward has been set to {reward}", ephemeral=True
         )
@@ -169,7 +211,7 @@ class TriviaCog(commands.Cog):
     async def trivia_loop(
         self, send_question: bool = True, show_answer: bool = True
     ) -> None:
-        channels = sql_client.get_channels()
+        channels = await db_executor.run(sql_client.get_channels)
         if not channels:
             return
         for channel_id, message_id, reward in channels:
@@ -182,11 +224,12 @@ class TriviaCog(commands.Cog):
                     message = None
                 if message is not None and self.current_question is None:
                     # If we don't have the question we don't know the answer, so we just wipe the question
-                    await message.delete()
+                    await action_queue.delete(message)
                 elif message is not None and self.current_question is not None:
                     # Provide the set of people who got the answer correct and incorrect
-                    correct_users = sql_client.get_correct_users(channel_id)
-                    incorrect_users = sql_client.get_incorrect_users(channel_id)
+                    correct_users, incorrect_users = await db_executor.run(
+                        sql_client.get_trivia_responses, channel_id, message_id
+                    )
                     if len(correct_users) or len(incorrect_users):
                         embed = discord.Embed(
                             title="Results", color=discord.Color.purple()
@@ -218,7 +261,8 @@ class TriviaCog(commands.Cog):
                         if show_answer
                         else self.current_question.get_choices()
                     )
-                    await message.edit(
+                    await action_queue.edit(
+                        message,
                         content=f"> {self.current_question.question}\n"
                         f'{", ".join(choices)}\n',
                         embed=embed,
@@ -227,17 +271,23 @@ class TriviaCog(commands.Cog):
 
             # Send today's trivia question
             if send_question:
-                self.current_question = self.get_question()
+                self.current_question = await self.get_question()
+                if self.current_question is None:
+                    await action_queue.send(
+                        channel, content="Bot couldn't fetch a trivia question for today, pls elp."
+                    )
+                    await db_executor.run(sql_client.update_message_id, channel_id, 0)
+                    continue
                 dropdown = views.DropdownView(
                     question=self.current_question, amount=reward
                 )
                 prompt = (
                     f"Today's daily trivia question!\n{self.current_question.question}"
                 )
-                message = await channel.send(content=prompt, view=dropdown)
-                sql_client.update_message_id(channel_id, message.id)
+                message = await action_queue.send(channel, content=prompt, view=dropdown)
+                await db_executor.run(sql_client.update_message_id, channel_id, message.id)
             else:
-                sql_client.update_message_id(channel_id, 0)
+                await db_executor.run(sql_client.update_message_id, channel_id, 0)
 
     @trivia_start.error
     @trivia_end.error
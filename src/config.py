@@ -2,12 +2,22 @@ from typing import Optional
 import yaml
 import os
 
-if not os.path.exists('../tmp'):
-    os.makedirs('../tmp')
+_config_map: Optional[dict] = None
 
-with open('./config.yml', encoding='utf-8') as f:
-    configMap = yaml.safe_load(f)
+
+def ensure_tmp_dir():
+    """Creates the folder holding the database and cached images"""
+    os.makedirs('../tmp', exist_ok=True)
+
+
+def _get_config_map() -> dict:
+    # read on first use rather than on import
+    global _config_map
+    if _config_map is None:
+        with open('./config.yml', encoding='utf-8') as f:
+            _config_map = yaml.safe_load(f)
+    return _config_map
 
 
 def get_attribute(field, default: Optional[str]='INVALIDKEY'):
-    return configMap.get(field, default)
+    return _get_config_map().get(field, default)
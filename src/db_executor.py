@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from src import stats
+
+T = TypeVar("T")
+
+# Waits longer than this are logged so slow disks show up in the logs
+SLOW_WAIT_SECONDS = 0.5
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]) -> None:
+    """Completes a future on its own event loop, ignoring callers that have given up on it"""
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class DatabaseExecutor:
+    """
+    Runs blocking database calls on one dedicated thread fed by a request queue.
+    SQLite and peewee calls made from coroutines go through run() so the event loop never waits on disk.
+    """
+
+    def __init__(self, name: str = "cactus-db") -> None:
+        self._requests: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        # set by group_commit, flushed by the worker once its batch window has passed
+        self.writer = None
+
+    def start(self) -> None:
+        with self._start_lock:
+            if not self._thread.is_alive():
+                self._thread.start()
+
+    def is_db_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    @property
+    def queue_depth(self) -> int:
+        return self._requests.qsize()
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Queues a blocking database call and waits for its result without blocking the event loop
+        :param func:
+        :param args:
+        :param kwargs:
+        :return: whatever func returns, exceptions are re-raised in the caller
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._requests.put((func, args, kwargs, loop, future, time.perf_counter()))
+        return await future
+
+    def shutdown(self) -> None:
+        """Finishes all queued calls and stops the database thread"""
+        if self._thread.is_alive():
+            self._requests.put(None)
+            self._thread.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            finished = self.completed + self.failed
+            return {
+                "queue_depth": self.queue_depth,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(1000 * self.total_wait / finished, 2) if finished else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 2),
+                "avg_run_ms": round(1000 * self.total_run / finished, 2) if finished else 0.0,
+            }
+
+    def _worker(self) -> None:
+        while True:
+            timeout = self.writer.time_until_flush() if self.writer else None
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                self._flush_writes()
+                continue
+            if request is None:
+                self._flush_writes()
+                break
+            func, args, kwargs, loop, future, submitted = request
+            started = time.perf_counter()
+            result, error = None, None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            self._record(started - submitted, time.perf_counter() - started, error is not None)
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                # the loop that asked for this result has already closed
+                logging.debug(f"Dropped database result for {getattr(func, '__name__', func)}, loop closed")
+            if self.writer and self.writer.time_until_flush() == 0:
+                self._flush_writes()
+
+    def _flush_writes(self) -> None:
+        if self.writer is None:
+            return
+        try:
+            self.writer.flush()
+        except Exception:
+            # already logged by the writer, the next batch starts fresh
+            pass
+
+    def _record(self, wait: float, run_time: float, failed: bool) -> None:
+        with self._stats_lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.total_wait += wait
+            self.total_run += run_time
+            self.max_wait = max(self.max_wait, wait)
+        if wait > SLOW_WAIT_SECONDS:
+            logging.warning(f"Database call waited {wait:.2f}s in queue ({self.queue_depth} still queued)")
+
+
+executor = DatabaseExecutor()
+stats.register("database", executor.get_stats)
+
+
+async def run(func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking database call on the database thread"""
+    return await executor.run(func, *args, **kwargs)
+
+
+def shutdown() -> None:
+    executor.shutdown()
@@ -0,0 +1,150 @@
+import logging
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from peewee import SqliteDatabase
+
+from src import config, db_executor, stats
+from src.models import database
+
+# Commits younger than this count towards the commits per second figure
+RATE_WINDOW_SECONDS = 60
+
+
+def _bucket(batch_size: int) -> str:
+    """Power of two histogram bucket for a batch size"""
+    upper = 1
+    while upper < batch_size:
+        upper *= 2
+    return f"<={upper}"
+
+
+class GroupCommitWriter:
+    """
+    Batches writes issued within a short window into one transaction so a burst of writes costs one fsync.
+    Writes must happen on the db_executor thread, which flushes the batch once the window has passed.
+    A window of 0 disables batching and every write commits on its own.
+    """
+
+    def __init__(self, db: SqliteDatabase, window: float) -> None:
+        self.database = db
+        self.window = window
+        self._transaction = None
+        # depth of writes committing on their own, writes nested in them join their transaction
+        self._direct_depth = 0
+        self._deadline: Optional[float] = None
+        self._batch_size = 0
+        self.commits = 0
+        self.writes = 0
+        self.failed_commits = 0
+        self.batch_sizes: Counter = Counter()
+        self._commit_times: deque = deque()
+        # run inside the batch right before it commits, for callers buffering their own writes
+        self.flush_hooks: List[Callable[[], None]] = []
+
+    @contextmanager
+    def write(self, durable: bool = False):
+        """
+        Wraps one logical write. Durable writes are committed before the context exits,
+        along with everything else in the open batch. Writes nested in a write that commits on its own
+        join its transaction instead of starting a batch inside it, whether they are durable or not.
+        :param durable:
+        :return:
+        """
+        if self._transaction is None and (durable or self.window <= 0 or self._direct_depth):
+            self._direct_depth += 1
+            try:
+                with self.database.atomic():
+                    yield
+            finally:
+                self._direct_depth -= 1
+            if not self._direct_depth:
+                self._record_commit(1)
+            return
+        if self._transaction is None:
+            self._transaction = self.database.transaction()
+            self._transaction.__enter__()
+            self._deadline = time.monotonic() + self.window
+        # savepoint so a failing write does not take the rest of the batch down with it
+        with self.database.atomic():
+            yield
+        self._batch_size += 1
+        if durable:
+            self.flush()
+
+    def in_batch(self) -> bool:
+        return self._transaction is not None
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds until the open batch is due, None when there is no open batch"""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def flush(self) -> None:
+        """Commits the open batch, if any"""
+        if self._transaction is None:
+            return
+        for hook in self.flush_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logging.error(f"Group commit flush hook {hook.__name__} failed: {e}")
+        transaction, batch_size = self._transaction, self._batch_size
+        self._transaction, self._deadline, self._batch_size = None, None, 0
+        try:
+            transaction.__exit__(None, None, None)
+        except Exception as e:
+            self.failed_commits += 1
+            logging.error(f"Group commit of {batch_size} writes failed and was rolled back: {e}")
+            raise
+        self._record_commit(batch_size)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        recent_commits = sum(1 for commit_time in list(self._commit_times) if now - commit_time <= RATE_WINDOW_SECONDS)
+        return {
+            "window_ms": round(self.window * 1000),
+            "commits": self.commits,
+            "writes": self.writes,
+            "failed_commits": self.failed_commits,
+            "commits_per_sec": round(recent_commits / RATE_WINDOW_SECONDS, 2),
+            "batch_sizes": ", ".join(f"{bucket}: {count}" for bucket, count in sorted(
+                self.batch_sizes.items(), key=lambda item: int(item[0][2:]))) or "none",
+        }
+
+    def _record_commit(self, batch_size: int) -> None:
+        self.commits += 1
+        self.writes += batch_size
+        self.batch_sizes[_bucket(batch_size)] += 1
+        now = time.monotonic()
+        self._commit_times.append(now)
+        while now - self._commit_times[0] > RATE_WINDOW_SECONDS:
+            self._commit_times.popleft()
+
+
+writer = GroupCommitWriter(database, config.get_attribute("groupCommitWindowMs", 0) / 1000)
+db_executor.executor.writer = writer
+stats.register("group commit", writer.get_stats)
+
+
+def write(durable: bool = False):
+    """Context manager for a write that joins the current group commit batch"""
+    return writer.write(durable)
+
+
+def flush() -> None:
+    """Commits any writes waiting in the current batch"""
+    writer.flush()
+
+
+def in_batch() -> bool:
+    """Whether writes are currently being held in an open batch"""
+    return writer.in_batch()
+
+
+def add_flush_hook(hook: Callable[[], None]) -> None:
+    """Registers a function that writes buffered rows into the batch right before it commits"""
+    writer.flush_hooks.append(hook)
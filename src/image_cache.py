@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from src import config, stats
+
+
+class ImageCache:
+    """
+    Bounded LRU cache of rendered PNGs. Keys should capture everything drawn in the image,
+    so an image is reused only while nothing it shows has changed and stale keys simply age out.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._images: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._images.move_to_end(key)
+            return image
+
+    def put(self, key: Hashable, image: bytes) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_size:
+                self._images.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._images),
+            "max_size": self.max_size,
+            "bytes": sum(len(image) for image in list(self._images.values())),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{100 * self.hits / lookups:.1f}%" if lookups else "n/a",
+            "evictions": self.evictions,
+        }
+
+
+rankings_cache = ImageCache(config.get_attribute("rankingsCacheSize", 8))
+stats.register("rankings cache", rankings_cache.get_stats)
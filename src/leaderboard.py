@@ -0,0 +1,119 @@
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src import stats
+
+
+class Leaderboard:
+    """
+    Every wallet sorted by coin, kept in step with each balance change so rankings never sort the AMOUNTS table.
+    Entries are stored as (-coin, member_id) so the richest member comes first.
+    Rank lookups are a binary search; updates are a binary search plus a list insert.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: List[Tuple[int, int]] = []
+        self._coins: Dict[int, int] = {}
+        # bumped on every change, lets callers tell whether anything moved since they last looked
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def seed(self, rows: Iterable[Tuple[int, Optional[int]]]) -> None:
+        """Replaces the leaderboard with (member_id, coin) rows, members without coin are skipped"""
+        coins = {member_id: coin for member_id, coin in rows if coin is not None}
+        with self._lock:
+            self._coins = coins
+            self._entries = sorted((-coin, member_id) for member_id, coin in coins.items())
+            self.version += 1
+
+    def update(self, member_id: int, coin: Optional[int]) -> None:
+        """Moves a member to the position for their new coin amount"""
+        with self._lock:
+            self._discard(member_id)
+            if coin is not None:
+                self._coins[member_id] = coin
+                insort(self._entries, (-coin, member_id))
+            self.version += 1
+
+    def remove(self, member_id: int) -> None:
+        with self._lock:
+            self._discard(member_id)
+            self.version += 1
+
+    def get_coin(self, member_id: int) -> Optional[int]:
+        return self._coins.get(member_id)
+
+    def rank(self, member_id: int) -> Optional[int]:
+        """1-based rank of a member, members with the same coin share a rank"""
+        with self._lock:
+            coin = self._coins.get(member_id)
+            if coin is None:
+                return None
+            return bisect_left(self._entries, (-coin,)) + 1
+
+    def top(self, count: Optional[int] = None, offset: int = 0) -> List[Tuple[int, int]]:
+        """(member_id, coin) for the richest members, richest first"""
+        with self._lock:
+            end = None if count is None else offset + count
+            return [(member_id, -negative_coin) for negative_coin, member_id in self._entries[offset:end]]
+
+    def ranked(self, include: Optional[Callable[[int], bool]] = None) -> Iterator[Tuple[int, int, int]]:
+        """
+        (rank, member_id, coin) richest first, members with the same coin share a rank
+        :param include: skips members it returns False for, ranks count only included members
+        :return:
+        """
+        with self._lock:
+            entries = self._entries[:]
+        rank, position, last_coin = 0, 0, None
+        for negative_coin, member_id in entries:
+            if include is not None and not include(member_id):
+                continue
+            position += 1
+            if -negative_coin != last_coin:
+                rank, last_coin = position, -negative_coin
+            yield rank, member_id, -negative_coin
+
+    def page(self, count: int, offset: int = 0,
+             include: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, int, int]]:
+        """(rank, member_id, coin) for `count` members starting after the first `offset`"""
+        return list(islice(self.ranked(include), offset, offset + count))
+
+    def around(self, member_id: int, count: int,
+               include: Optional[Callable[[int], bool]] = None) -> Optional[List[Tuple[int, int, int]]]:
+        """
+        (rank, member_id, coin) for `count` members with the given member in the middle when possible,
+        None if the member isn't ranked
+        """
+        window: "deque[Tuple[int, int, int]]" = deque(maxlen=count)
+        below = None
+        for row in self.ranked(include):
+            window.append(row)
+            if below is None and row[1] == member_id:
+                below = count // 2
+            elif below is not None:
+                below -= 1
+            if below is not None and below <= 0 and len(window) == count:
+                break
+        return list(window) if below is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"members": len(self), "version": self.version}
+
+    def _discard(self, member_id: int) -> None:
+        coin = self._coins.pop(member_id, None)
+        if coin is None:
+            return
+        idx = bisect_left(self._entries, (-coin, member_id))
+        if idx < len(self._entries) and self._entries[idx] == (-coin, member_id):
+            del self._entries[idx]
+
+
+leaderboard = Leaderboard()
+stats.register("leaderboard", leaderboard.get_stats)
@@ -0,0 +1,109 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from peewee import fn
+
+from src import group_commit
+from src.models import Transaction, database
+
+# Buffered rows are written with one insert when the group commit batch closes, or once this many pile up
+MAX_PENDING = 500
+PAGE_SIZE = 10
+
+_pending: List[Dict[str, Any]] = []
+_last_timestamp = datetime.min
+
+
+def _next_timestamp() -> datetime:
+    """UTC timestamp that is strictly later than the previous one, even if the clock steps backwards"""
+    global _last_timestamp
+    if _last_timestamp == datetime.min:
+        # continue from the newest stored entry so restarts keep the ordering too
+        _last_timestamp = Transaction.select(fn.MAX(Transaction.date)).scalar() or datetime.min
+    _last_timestamp = max(datetime.utcnow(), _last_timestamp + timedelta(microseconds=1))
+    return _last_timestamp
+
+
+def _entry(member_id: int, coin: int, guild_id: Optional[int], memo: Optional[str]) -> Dict[str, Any]:
+    return {
+        "member_id": member_id,
+        "guild_id": guild_id,
+        "coin": coin,
+        "memo": memo,
+        "date": _next_timestamp(),
+    }
+
+
+def record(member_id: int, coin: int, guild_id: Optional[int] = None, memo: Optional[str] = None,
+           durable: bool = False) -> None:
+    """
+    Appends a coin change to a member's ledger. Must be called from the database thread.
+    :param member_id:
+    :param coin:
+    :param guild_id:
+    :param memo:
+    :param durable: write and commit the row before returning
+    :return:
+    """
+    record_many([(member_id, coin, guild_id, memo)], durable=durable)
+
+
+def record_many(entries: List[Tuple[int, int, Optional[int], Optional[str]]], durable: bool = False) -> None:
+    """
+    Appends several (member_id, coin, guild_id, memo) changes that are written in the same insert
+    :param entries:
+    :param durable:
+    :return:
+    """
+    _pending.extend(_entry(*entry) for entry in entries)
+    if durable or not group_commit.in_batch() or len(_pending) >= MAX_PENDING:
+        flush(durable)
+
+
+def flush(durable: bool = False) -> None:
+    """Writes all buffered ledger rows"""
+    if not _pending:
+        return
+    rows = _pending[:]
+    _pending.clear()
+    with group_commit.write(durable):
+        Transaction.insert_many(rows).execute()
+
+
+def get_history(member_id: int, limit: int = PAGE_SIZE,
+                before: Optional[Tuple[datetime, int]] = None) -> List[Transaction]:
+    """
+    Gets a page of a member's ledger, newest first. Pages are keyed on (date, id) rather than an offset,
+    so every page is a range scan on the (member_id, date) index no matter how long the history is.
+    :param member_id:
+    :param limit:
+    :param before: (date, id) of the last row of the previous page
+    :return:
+    """
+    flush()
+    query = Transaction.select().where(Transaction.member_id == member_id)
+    if before is not None:
+        before_date, before_id = before
+        query = query.where(
+            (Transaction.date < before_date) | ((Transaction.date == before_date) & (Transaction.id < before_id))
+        )
+    return list(query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit))
+
+
+def remove_history(member_id: int, durable: bool = False) -> None:
+    """Removes every ledger entry for a member"""
+    remove_histories([member_id], durable=durable)
+
+
+def remove_histories(member_ids: List[int], durable: bool = False) -> int:
+    """Removes every ledger entry for all the given members in one statement, returns the number of rows removed"""
+    flush()
+    with group_commit.write(durable):
+        # ids go in as one JSON parameter, a guild can have more members than SQLite allows bound variables
+        return database.execute_sql(
+            "DELETE FROM TRANSACTIONS WHERE member_id IN (SELECT value FROM json_each(?))", (json.dumps(member_ids),)
+        ).rowcount
+
+
+group_commit.add_flush_hook(flush)
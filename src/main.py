@@ -1,34 +1,86 @@
+import time
+
+_started = time.perf_counter()
+
 import asyncio
-import atexit
+from contextlib import contextmanager
 import logging
 import signal
 import sys
+from typing import Dict
 
-from src.api_handlers.food_handler import generate_food_questions
-from src.cogs.main_cog import BotCog
-from src.cogs.challenges_cog import ChallengesCog
 import src.config as config
-from src.models import database, TABLES
+from src import db_executor, migrations, sql_client, stats
+from src.models import database, Food, TABLES
+from src.chart_renderer import renderer
 
 
 import discord
 from discord.ext import commands
 
+# seconds spent in each startup phase, in the order they ran
+startup_timings: Dict[str, float] = {"imports": time.perf_counter() - _started}
+stats.register("startup", lambda: {phase: f"{1000 * seconds:.0f} ms" for phase, seconds in startup_timings.items()})
+
+
+@contextmanager
+def timed(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[phase] = time.perf_counter() - start
 
 
 async def setup(initiated_bot: commands.Bot):
+    # cogs pull in the bot helpers, views and API handlers, so they are imported once the database is ready
+    from src.cogs.main_cog import BotCog
+    from src.cogs.challenges_cog import ChallengesCog
+
     await initiated_bot.add_cog(BotCog(initiated_bot))
     await initiated_bot.add_cog(ChallengesCog(initiated_bot))
     # await bot.add_cog(TriviaCog(bot))
 
 
+def init_database():
+    config.ensure_tmp_dir()
+    with timed("database init"):
+        database.connect(reuse_if_open=True)
+        migrations.migrate()
+    with timed("table creation"):
+        # raw tables first, their schema predates the model for AMOUNTS
+        sql_client.create_tables()
+        database.create_tables(TABLES)
+        sql_client.load_leaderboard()
+
+
+async def init_food_questions():
+    with timed("food generation"):
+        # the food cog pulls more questions whenever it runs out, so only fill an empty pool here
+        if not await db_executor.run(Food.select().where(Food.used == False).exists):
+            from src.api_handlers.food_handler import generate_food_questions
+            await generate_food_questions()
+
+
 async def main(initiated_bot: commands.Bot):
     token = config.get_attribute('token', None)
-    database.connect()
-    database.create_tables(TABLES)
-    generate_food_questions()
+    await db_executor.run(init_database)
+    await init_food_questions()
     if token:
-        await setup(initiated_bot)
+        with timed("cog setup"):
+            await setup(initiated_bot)
+        login_started = time.perf_counter()
+
+        async def report_startup():
+            if "gateway login" in startup_timings:
+                return
+            startup_timings["gateway login"] = time.perf_counter() - login_started
+            startup_timings["total"] = time.perf_counter() - _started
+            logging.info("Startup took " + ", ".join(
+                f"{phase} {1000 * seconds:.0f} ms" for phase, seconds in startup_timings.items()
+            ))
+
+        initiated_bot.add_listener(report_startup, "on_ready")
         await initiated_bot.start(token)
     else:
         logging.error('No token provided in config.yml, bot not started.')
@@ -36,6 +88,21 @@ async def main(initiated_bot: commands.Bot):
 def invoke_exit(_signo, _frame):
     sys.exit(0)
 
+
+def shutdown(initiated_bot: commands.Bot):
+    logging.info('Closing client down...')
+    try:
+        if not initiated_bot.is_closed():
+            asyncio.run(initiated_bot.close())
+    except Exception:
+        logging.exception('Failed to close the Discord client')
+    finally:
+        # flushes the open group commit batch and its hooks before the connection goes away
+        db_executor.shutdown()
+        renderer.shutdown()
+        database.close()
+
+
 if __name__ == "__main__":
     logging.basicConfig(stream=sys.stderr, level=config.get_attribute('logLevel', 'INFO'))
     # This is needed to get full list of members
@@ -45,9 +112,8 @@ if __name__ == "__main__":
     bot = commands.Bot(command_prefix='?', intents=intents, help_command=None)
     signal.signal(signal.SIGTERM, invoke_exit)
     signal.signal(signal.SIGINT, invoke_exit)
-    asyncio.run(main(initiated_bot=bot))
-
-    @atexit.register
-    def handle_exit():
-        logging.info('Closing client down...')
-        asyncio.run(bot.close())
+    # SIGTERM and SIGINT raise SystemExit out of asyncio.run, so shutdown has to run from here
+    try:
+        asyncio.run(main(initiated_bot=bot))
+    finally:
+        shutdown(bot)
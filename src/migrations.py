@@ -0,0 +1,80 @@
+import json
+import logging
+from datetime import datetime
+
+from src import balance_history, sql_client
+from src.models import BalanceDaily, database, Transaction
+
+
+def migrate():
+    """Brings tables created by older versions of the bot up to the current schema, run before creating tables"""
+    _migrate_transactions()
+    _migrate_trivia_responses()
+    _seed_balance_history()
+
+
+def _migrate_transactions():
+    """
+    Older TRANSACTIONS tables stored the member id in the id column with no ledger metadata or indexes.
+    Rebuilds them as the indexed ledger, keeping every row that belongs to a member.
+    """
+    if not database.table_exists(Transaction._meta.table_name):
+        return
+    columns = [column.name for column in database.get_columns(Transaction._meta.table_name)]
+    if "member_id" in columns:
+        return
+    logging.info("Migrating TRANSACTIONS to the member ledger schema")
+    with database.atomic():
+        database.execute_sql("ALTER TABLE TRANSACTIONS RENAME TO TRANSACTIONS_LEGACY")
+        Transaction.create_table()
+        copied = database.execute_sql(
+            "INSERT INTO TRANSACTIONS(member_id, coin, memo, date) "
+            "SELECT id, coalesce(coin, 0), memo, date FROM TRANSACTIONS_LEGACY "
+            "WHERE id IS NOT NULL AND date IS NOT NULL ORDER BY date"
+        ).rowcount
+        database.execute_sql("DROP TABLE TRANSACTIONS_LEGACY")
+    logging.info(f"Migrated {copied} transactions to the member ledger")
+
+
+def _migrate_trivia_responses():
+    """
+    Older TRIVIA_CHANNELS rows kept the users who answered the current question as JSON lists.
+    Moves those answers into TRIVIA_RESPONSES and empties the lists so this only happens once.
+    """
+    if not database.table_exists("TRIVIA_CHANNELS"):
+        return
+    columns = [column.name for column in database.get_columns("TRIVIA_CHANNELS")]
+    if "correct_users" not in columns:
+        return
+    sql_client.create_tables()
+    rows = database.execute_sql(
+        "SELECT channel_id, message_id, correct_users, incorrect_users FROM TRIVIA_CHANNELS "
+        "WHERE correct_users IS NOT NULL OR incorrect_users IS NOT NULL"
+    ).fetchall()
+    if not rows:
+        return
+    logging.info("Migrating trivia answers to TRIVIA_RESPONSES")
+    now = datetime.utcnow()
+    with database.atomic():
+        for channel_id, message_id, correct_users, incorrect_users in rows:
+            for users, correct in ((correct_users, True), (incorrect_users, False)):
+                user_ids = json.loads(users)["users"] if users else []
+                database.cursor().executemany(
+                    "INSERT OR IGNORE INTO TRIVIA_RESPONSES(channel_id, message_id, user_id, correct, answered_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(channel_id, message_id, user_id, correct, now) for user_id in user_ids or []]
+                )
+        database.execute_sql("UPDATE TRIVIA_CHANNELS SET correct_users = NULL, incorrect_users = NULL")
+
+
+def _seed_balance_history():
+    """Starts BALANCE_DAILY from everyone's current balance when it is first created, older days are not known"""
+    if database.table_exists(BalanceDaily._meta.table_name) or not database.table_exists("AMOUNTS"):
+        return
+    with database.atomic():
+        BalanceDaily.create_table()
+        seeded = database.execute_sql(
+            "INSERT INTO BALANCE_DAILY(member_id, day, balance) SELECT id, ?, coin FROM AMOUNTS WHERE coin IS NOT NULL",
+            (balance_history.today().isoformat(),)
+        ).rowcount
+    logging.info(f"Seeded daily balance history for {seeded} wallets")
@@ -1,8 +1,16 @@
 from datetime import datetime
-from peewee import SqliteDatabase, IntegerField, AutoField, DateField, TextField, Model, BooleanField, CharField, ForeignKeyField
+from peewee import SqliteDatabase, IntegerField, AutoField, CompositeKey, DateField, DateTimeField, TextField, Model, BooleanField, CharField, ForeignKeyField
 import src.config as config
 
-database = SqliteDatabase(config.get_attribute('dbFile'), pragmas={'foreign_keys': 1})
+# The single connection for the whole bot, shared by sql_client and the models below.
+# Every query is serialized through the db_executor thread, so the connection is not thread-local.
+database = SqliteDatabase(
+    config.get_attribute('dbFile'),
+    pragmas={'foreign_keys': 1, 'journal_mode': 'wal'},
+    thread_safe=False,
+    check_same_thread=False,
+    cached_statements=256,
+)
 
 
 class UnknownField(object):
@@ -25,14 +33,31 @@ class Amount(BaseModel):
 
 
 class Transaction(BaseModel):
-    """Model for transactions between users"""
+    """Append-only ledger of every recorded change to a member's coin, written through src.ledger"""
     id = AutoField()
-    coin = IntegerField(null=True)
-    date = DateField(null=True)
+    member_id = IntegerField()
+    guild_id = IntegerField(null=True)
+    coin = IntegerField()
+    memo = TextField(null=True)
+    # never goes backwards, so (member_id, date) orders a member's history
+    date = DateTimeField()
 
     class Meta:
         table_name = "TRANSACTIONS"
-        primary_key = False
+        indexes = (
+            (("member_id", "date"), False),
+        )
+
+
+class BalanceDaily(BaseModel):
+    """A member's closing balance on each day it changed, kept up to date by src.balance_history"""
+    member_id = IntegerField()
+    day = DateField()
+    balance = IntegerField()
+
+    class Meta:
+        table_name = "BALANCE_DAILY"
+        primary_key = CompositeKey("member_id", "day")
 
 
 class FoodAnswer(BaseModel):
@@ -75,5 +100,5 @@ class Game(BaseModel):
     id = AutoField()
     name = CharField()
 
-TABLES = [Amount, Transaction, FoodAnswer, Food, CountryAnswer, FoodChannel, ChallengeChannel, Game]
+TABLES = [Amount, Transaction, BalanceDaily, FoodAnswer, Food, CountryAnswer, FoodChannel, ChallengeChannel, Game]
 
@@ -0,0 +1,173 @@
+from collections import Counter
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import discord
+
+from src import config, stats
+
+
+def coin_role_prefix() -> str:
+    return config.get_attribute("rolePrefix", "Cactus Coin: ")
+
+
+def is_coin_role(role: discord.Role) -> bool:
+    return coin_role_prefix() in role.name
+
+
+def coin_role_name(amount: int) -> str:
+    return f'{coin_role_prefix()}{format(amount, ",d")}'
+
+
+class _GuildRoles:
+    """One guild's coin roles by name, and how many members hold each of them"""
+
+    def __init__(self) -> None:
+        self.by_name: Dict[str, int] = {}
+        self.member_counts: Counter = Counter()
+        # when each role was last created or picked for a member, its edit may still be waiting in the queue
+        self.last_used: Dict[int, float] = {}
+
+
+class RoleIndex:
+    """
+    Per-guild index of cactus coin roles, built once from the guild cache and then kept current from gateway
+    events, so finding the role for an amount or spotting empty roles never walks guild.roles or role.members.
+    """
+
+    def __init__(self) -> None:
+        self._guilds: Dict[int, _GuildRoles] = {}
+        self.builds = 0
+        self.events = 0
+
+    def build(self, guild: discord.Guild) -> None:
+        """Indexes a guild from scratch, one pass over its roles and one over its members"""
+        index = _GuildRoles()
+        for role in guild.roles:
+            if is_coin_role(role):
+                index.by_name[role.name] = role.id
+                index.member_counts[role.id] = 0
+        for member in guild.members:
+            for role in member.roles:
+                if role.id in index.member_counts:
+                    index.member_counts[role.id] += 1
+        self._guilds[guild.id] = index
+        self.builds += 1
+
+    def _get(self, guild: discord.Guild) -> _GuildRoles:
+        if guild.id not in self._guilds:
+            self.build(guild)
+        return self._guilds[guild.id]
+
+    def get_role(self, guild: discord.Guild, name: str) -> Optional[discord.Role]:
+        role_id = self._get(guild).by_name.get(name)
+        return guild.get_role(role_id) if role_id is not None else None
+
+    def member_count(self, role: discord.Role) -> int:
+        return self._get(role.guild).member_counts.get(role.id, 0)
+
+    def role_count(self, guild: discord.Guild) -> int:
+        return len(self._get(guild).member_counts)
+
+    def empty_roles(self, guild: discord.Guild, idle_for: float = 0) -> List[discord.Role]:
+        """Roles nobody holds that also haven't been created or picked for anyone in the last `idle_for` seconds"""
+        index = self._get(guild)
+        roles = (
+            guild.get_role(role_id) for role_id, count in index.member_counts.items()
+            if count <= 0 and not self.used_within(role_id, index, idle_for)
+        )
+        return [role for role in roles if role is not None]
+
+    @staticmethod
+    def used_within(role_id: int, index: _GuildRoles, seconds: float) -> bool:
+        last_used = index.last_used.get(role_id)
+        return last_used is not None and time.monotonic() - last_used < seconds
+
+    def is_idle(self, role: discord.Role, idle_for: float) -> bool:
+        """True when nobody holds the role and it hasn't been created or picked for anyone recently"""
+        index = self._get(role.guild)
+        return index.member_counts.get(role.id, 0) <= 0 and not self.used_within(role.id, index, idle_for)
+
+    def touch(self, role: discord.Role) -> None:
+        """Marks a role as about to be given to a member, so the role sweep leaves it alone for a while"""
+        index = self._guilds.get(role.guild.id)
+        if index is not None and role.id in index.member_counts:
+            index.last_used[role.id] = time.monotonic()
+
+    def add_role(self, role: discord.Role) -> None:
+        """For on_guild_role_create, and for roles the bot just created so they're found before the event arrives"""
+        if role.guild.id not in self._guilds or not is_coin_role(role):
+            return
+        index = self._guilds[role.guild.id]
+        index.by_name[role.name] = role.id
+        index.member_counts.setdefault(role.id, 0)
+        index.last_used[role.id] = time.monotonic()
+
+    def remove_role(self, role: discord.Role) -> None:
+        """For on_guild_role_delete"""
+        index = self._guilds.get(role.guild.id)
+        if index is None:
+            return
+        if index.by_name.get(role.name) == role.id:
+            del index.by_name[role.name]
+        index.member_counts.pop(role.id, None)
+        index.last_used.pop(role.id, None)
+
+    def on_role_create(self, role: discord.Role) -> None:
+        self.events += 1
+        self.add_role(role)
+
+    def on_role_delete(self, role: discord.Role) -> None:
+        self.events += 1
+        self.remove_role(role)
+
+    def on_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        if before.name == after.name:
+            return
+        self.events += 1
+        index = self._guilds.get(after.guild.id)
+        if index is None:
+            return
+        if index.by_name.get(before.name) == before.id:
+            del index.by_name[before.name]
+        if is_coin_role(after):
+            index.by_name[after.name] = after.id
+            if after.id not in index.member_counts:
+                index.member_counts[after.id] = len(after.members)
+        else:
+            index.member_counts.pop(after.id, None)
+
+    def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        self._move(after.guild, before.roles, after.roles)
+
+    def on_member_remove(self, member: discord.Member) -> None:
+        self._move(member.guild, member.roles, [])
+
+    def _move(self, guild: discord.Guild, before: Iterable[discord.Role], after: Iterable[discord.Role]) -> None:
+        index = self._guilds.get(guild.id)
+        if index is None:
+            return
+        before_ids = {role.id for role in before} & index.member_counts.keys()
+        after_ids = {role.id for role in after} & index.member_counts.keys()
+        if before_ids == after_ids:
+            return
+        self.events += 1
+        for role_id in before_ids - after_ids:
+            index.member_counts[role_id] -= 1
+        for role_id in after_ids - before_ids:
+            index.member_counts[role_id] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "guilds": len(self._guilds),
+            "roles": sum(len(index.member_counts) for index in self._guilds.values()),
+            "empty_roles": sum(
+                1 for index in self._guilds.values() for count in index.member_counts.values() if count <= 0
+            ),
+            "builds": self.builds,
+            "events": self.events,
+        }
+
+
+role_index = RoleIndex()
+stats.register("role index", role_index.get_stats)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import discord
+
+from src import config, stats
+
+RoleApplier = Callable[[discord.Guild, discord.Member, int], Awaitable]
+
+
+class RateBudget:
+    """Token bucket for one guild's role edits, refilled evenly so bursts stay inside Discord's bucket"""
+
+    def __init__(self, per_minute: float, burst: int) -> None:
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waits = 0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.waits += 1
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class _Pending:
+    guild: discord.Guild
+    member: discord.Member
+    amount: int
+    first_at: float
+    last_at: float
+    task: Optional[asyncio.Task] = None
+
+
+class RoleScheduler:
+    """
+    Debounces coin role updates. Only the latest amount asked for a member is kept, and it is applied once the
+    member has been quiet for `quiet` seconds, or `max_delay` seconds after the first request at the latest.
+    Updates then wait on their guild's rate budget, still coalescing anything that arrives in the meantime.
+    """
+
+    def __init__(self, quiet: float, max_delay: float, per_minute: float) -> None:
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.per_minute = per_minute
+        # applies a member's role for an amount, set by bot_helper
+        self.apply: Optional[RoleApplier] = None
+        self._pending: Dict[Tuple[int, int], _Pending] = {}
+        self._budgets: Dict[int, RateBudget] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.scheduled = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_delay = 0.0
+
+    def schedule(self, guild: discord.Guild, member: discord.Member, amount: int) -> None:
+        """Asks for the member's role to show an amount, replacing whatever was asked before it was applied"""
+        self.scheduled += 1
+        key = (guild.id, member.id)
+        now = time.monotonic()
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            pending.member = member
+            pending.amount = amount
+            pending.last_at = now
+            return
+        pending = self._pending[key] = _Pending(guild, member, amount, now, now)
+        pending.task = asyncio.create_task(self._run(key), name=f"role-update-{member.id}")
+        self._tasks.add(pending.task)
+        pending.task.add_done_callback(self._tasks.discard)
+
+    def cancel(self, guild: discord.Guild, member: discord.Member) -> bool:
+        """
+        Drops the member's pending update, for when their wallet is cleared. An update already being applied
+        can't be dropped, it holds the member's role lock until it's done.
+        :return: whether an update was dropped
+        """
+        pending = self._pending.pop((guild.id, member.id), None)
+        if pending is None:
+            return False
+        self.cancelled += 1
+        pending.task.cancel()
+        return True
+
+    def _budget(self, guild_id: int) -> RateBudget:
+        if guild_id not in self._budgets:
+            self._budgets[guild_id] = RateBudget(self.per_minute, max(1, round(self.per_minute / 6)))
+        return self._budgets[guild_id]
+
+    async def _run(self, key: Tuple[int, int]) -> None:
+        pending = self._pending[key]
+        while True:
+            due = min(pending.last_at + self.quiet, pending.first_at + self.max_delay)
+            remaining = due - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        await self._budget(key[0]).acquire()
+        # taken only now, so changes made while waiting on the budget are folded in too
+        pending = self._pending.pop(key)
+        try:
+            await self.apply(pending.guild, pending.member, pending.amount)
+            self.applied += 1
+            self.total_delay += time.monotonic() - pending.first_at
+        except Exception:
+            self.failed += 1
+            logging.exception(f"Role update failed for {pending.member.display_name}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "applied": self.applied,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "pending": len(self._pending),
+            "avg_delay_ms": round(1000 * self.total_delay / self.applied) if self.applied else 0,
+            "rate_limit_waits": sum(budget.waits for budget in self._budgets.values()),
+        }
+
+
+role_scheduler = RoleScheduler(
+    config.get_attribute("roleUpdateQuietMs", 2000) / 1000,
+    config.get_attribute("roleUpdateMaxDelayMs", 10000) / 1000,
+    config.get_attribute("roleUpdatesPerMinute", 60),
+)
+stats.register("role scheduler", role_scheduler.get_stats)
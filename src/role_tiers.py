@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+from math import ceil
+from typing import List, Optional
+
+import discord
+
+from src import config
+from src.leaderboard import leaderboard
+from src.role_index import coin_role_name, coin_role_prefix
+
+
+@dataclass(frozen=True)
+class Tier:
+    """
+    A coin role shared by everyone it matches. A tier with `min` matches members with at least that much coin,
+    one with `top` matches members ranked in that top percent of the leaderboard, one with neither matches everyone.
+    """
+
+    name: str
+    min: Optional[int] = None
+    top: Optional[float] = None
+
+    @property
+    def role_name(self) -> str:
+        return f"{coin_role_prefix()}{self.name}"
+
+    def matches(self, member_id: int, amount: int) -> bool:
+        if self.min is not None and amount < self.min:
+            return False
+        if self.top is not None:
+            rank = leaderboard.rank(member_id)
+            if rank is None or rank > max(1, ceil(len(leaderboard) * self.top / 100)):
+                return False
+        return True
+
+
+def _load_tiers() -> List[Tier]:
+    tiers = []
+    for entry in config.get_attribute("roleTiers", None) or []:
+        if "name" not in entry:
+            raise ValueError(f"roleTiers entry without a name: {entry}")
+        tiers.append(Tier(str(entry["name"]), entry.get("min"), entry.get("top")))
+    return tiers
+
+
+# checked in order, a member gets the first tier they match
+tiers: List[Tier] = _load_tiers()
+_tier_role_names = {tier.role_name for tier in tiers}
+
+
+def enabled() -> bool:
+    return bool(tiers)
+
+
+def role_name(member_id: int, amount: int) -> Optional[str]:
+    """Name of the coin role for a member's amount, or None when tier mode is on and no tier matches"""
+    if not tiers:
+        return coin_role_name(amount)
+    for tier in tiers:
+        if tier.matches(member_id, amount):
+            return tier.role_name
+    return None
+
+
+def is_tier_role(role: discord.Role) -> bool:
+    """Tier roles are kept when nobody holds them, they'll be handed out again"""
+    return role.name in _tier_role_names
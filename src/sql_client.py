@@ -1,134 +1,247 @@
 import json
 import sqlite3
-import atexit
 from datetime import datetime
-from typing import List
-import signal
+from typing import List, Optional, Set, Tuple
 
-from . import config
+from src import balance_history, group_commit, ledger
+from src.leaderboard import leaderboard
+from src.models import database
+from src.wallet_cache import MISSING, wallet_cache
 
 
-# TODO: This is messy, should really be using an ORM to manage these
+# Raw queries share the peewee connection in models, so there is only one connection to the database file.
+# Queries are parameterized with constant SQL text so sqlite3 can reuse its cached prepared statements.
+# Mutators join the current group commit batch unless durable is set, in which case they commit before returning.
 
-try:
-    connection = sqlite3.connect(config.get_attribute('dbFile'))
-    connection.execute('CREATE TABLE IF NOT EXISTS AMOUNTS (id integer PRIMARY KEY, coin integer, correct_answers integer, incorrect_answers integer)')
-    connection.execute('CREATE TABLE IF NOT EXISTS TRANSACTIONS (id integer, coin integer, memo text, date date)')
-    connection.execute(
-        'CREATE TABLE IF NOT EXISTS TRIVIA_CHANNELS (channel_id integer, message_id integer, correct_users text, incorrect_users text, reward integer, UNIQUE (channel_id))'
+
+def _execute(sql: str, params: tuple = ()) -> sqlite3.Cursor:
+    return database.execute_sql(sql, params)
+
+
+def create_tables():
+    """Creates the tables that are managed through raw queries instead of models"""
+    _execute('CREATE TABLE IF NOT EXISTS AMOUNTS (id integer PRIMARY KEY, coin integer, correct_answers integer, incorrect_answers integer)')
+    _execute('CREATE INDEX IF NOT EXISTS amounts_coin ON AMOUNTS (coin)')
+    _execute(
+        'CREATE TABLE IF NOT EXISTS TRIVIA_CHANNELS (channel_id integer, message_id integer, reward integer, UNIQUE (channel_id))'
+    )
+    _execute(
+        'CREATE TABLE IF NOT EXISTS TRIVIA_RESPONSES (channel_id integer, message_id integer, user_id integer, correct integer, answered_at timestamp)'
+    )
+    # one answer per user per question, and the index the daily results are read from
+    _execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS trivia_responses_answer ON TRIVIA_RESPONSES (channel_id, message_id, user_id)'
     )
-    connection.execute(
+    _execute(
         'CREATE TABLE IF NOT EXISTS TRIVIA_HASHES (hash integer, unique (hash))'
     )
-except sqlite3.Error as e:
-    print(e)
 
 
-def handle_exit():
-    if connection:
-        connection.close()
+def _write_amounts(amounts: List[Tuple[int, int]]):
+    """Upserts (member_id, coin) pairs held back by the write-behind wallet cache"""
+    with group_commit.write():
+        database.cursor().executemany(
+            "INSERT INTO AMOUNTS(id, coin) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET coin=excluded.coin",
+            amounts)
 
 
-atexit.register(handle_exit)
-signal.signal(signal.SIGTERM, handle_exit)
-signal.signal(signal.SIGINT, handle_exit)
-
-
-def update_coin(member_id: int, amount: int):
+def update_coin(member_id: int, amount: int, durable: bool = False):
     """
     Upserts a user's coin to the given amount
     :param member_id:
     :param amount:
+    :param durable:
     :return:
     """
-    cur = connection.cursor()
-    cur.execute(
-        "INSERT INTO AMOUNTS(id, coin) VALUES ('{0}', {1}) ON CONFLICT(id) DO UPDATE SET coin=excluded.coin".format(
-            member_id, amount))
-    connection.commit()
+    # write-behind needs an open batch to flush it, durable writes always go straight to the table
+    write_behind = wallet_cache.write_behind and not durable and group_commit.writer.window > 0
+    with group_commit.write(durable):
+        if write_behind:
+            wallet_cache.put(member_id, amount, dirty=True)
+        else:
+            _execute("INSERT INTO AMOUNTS(id, coin) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET coin=excluded.coin",
+                     (member_id, amount))
+            wallet_cache.put(member_id, amount)
+        balance_history.record(member_id, amount)
+    leaderboard.update(member_id, amount)
     return amount
 
 
 def get_coin(member_id: int):
     """
-    Gets member's coin
+    Gets member's coin, from the wallet cache when possible
     :param member_id:
     :return:
     """
-    cur = connection.cursor()
-    amount = cur.execute("SELECT coin from AMOUNTS WHERE id IS '{0}'".format(member_id)).fetchone()
-    if amount:
-        return amount[0]
-    return None
+    cached = wallet_cache.get(member_id)
+    if cached is not MISSING:
+        return cached
+    return _load_coin(member_id)
+
+
+def _load_coin(member_id: int):
+    """Reads member's coin from the database and caches it, for callers that already missed the cache"""
+    row = _execute("SELECT coin FROM AMOUNTS WHERE id = ?", (member_id,)).fetchone()
+    amount = row[0] if row else None
+    wallet_cache.put(member_id, amount)
+    return amount
 
 
-def remove_coin(member_id: int):
+def remove_coin(member_id: int, durable: bool = False):
     """
     Clears out all coin from a member's entry
     :param member_id:
+    :param durable:
     :return:
     """
-    cur = connection.cursor()
-    cur.execute("DELETE FROM AMOUNTS WHERE id is '{0}'".format(member_id))
-    connection.commit()
+    with group_commit.write(durable):
+        _execute("DELETE FROM AMOUNTS WHERE id = ?", (member_id,))
+        wallet_cache.put(member_id, None)
+    leaderboard.remove(member_id)
+
+
+def transfer_coin(sender_id: int, recipient_id: int, amount: int, debt_limit: int, default_coin: int,
+                  guild_id: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """
+    Moves coin between two wallets in one durable transaction, with both ledger rows written together.
+    The debt limit is checked by the upsert itself, so there is no read-modify-write to race.
+    :param sender_id:
+    :param recipient_id:
+    :param amount:
+    :param debt_limit:
+    :param default_coin: starting amount for a sender or recipient without a wallet
+    :param guild_id:
+    :return: the new (sender, recipient) amounts, or None if the sender would go past the debt limit
+    """
+    # amounts held back by the write-behind cache have to be in the table before it is updated in place
+    wallet_cache.flush()
+    with group_commit.write(durable=True):
+        # a sender without a wallet, or with a NULL coin, spends from the default amount like add_coin does
+        debited = _execute("INSERT INTO AMOUNTS(id, coin) SELECT ?, ? - ? WHERE ? - ? >= ? "
+                           "ON CONFLICT(id) DO UPDATE SET coin = coalesce(coin, ?) - ? "
+                           "WHERE coalesce(coin, ?) - ? >= ?",
+                           (sender_id, default_coin, amount, default_coin, amount, debt_limit,
+                            default_coin, amount, default_coin, amount, debt_limit)).rowcount
+        if not debited:
+            return None
+        _execute("INSERT INTO AMOUNTS(id, coin) VALUES (?, ?) "
+                 "ON CONFLICT(id) DO UPDATE SET coin = coalesce(coin, ?) + ?",
+                 (recipient_id, default_coin + amount, default_coin, amount))
+        ledger.record_many([
+            (sender_id, -amount, guild_id, f"Gift to <@{recipient_id}>"),
+            (recipient_id, amount, guild_id, f"Gift from <@{sender_id}>"),
+        ])
+        amounts = dict(_execute("SELECT id, coin FROM AMOUNTS WHERE id IN (?, ?)", (sender_id, recipient_id)).fetchall())
+        balance_history.record_many(amounts.items())
+    for member_id, coin in amounts.items():
+        wallet_cache.put(member_id, coin)
+        leaderboard.update(member_id, coin)
+    return amounts[sender_id], amounts[recipient_id]
+
+
+def reset_coin(member_ids: List[int], amount: int) -> List[int]:
+    """
+    Sets the coin of every listed member that has a wallet to the given amount in one statement
+    :param member_ids:
+    :param amount:
+    :return: ids of the members whose wallets were reset
+    """
+    ids = json.dumps(member_ids)
+    # pending write-behind amounts would otherwise land on top of the reset
+    wallet_cache.flush()
+    with group_commit.write(durable=True):
+        reset_ids = [row[0] for row in _execute(
+            "SELECT id FROM AMOUNTS WHERE id IN (SELECT value FROM json_each(?))", (ids,)).fetchall()]
+        _execute("UPDATE AMOUNTS SET coin = ? WHERE id IN (SELECT value FROM json_each(?))", (amount, ids))
+        balance_history.record_many((member_id, amount) for member_id in reset_ids)
+    wallet_cache.invalidate()
+    load_leaderboard()
+    return reset_ids
+
+
+def clear_coin(member_ids: List[int]) -> List[Tuple[int, Optional[int]]]:
+    """
+    Deletes the wallets and ledger history of every listed member in one transaction
+    :param member_ids:
+    :return: (member_id, coin) for every wallet that was deleted
+    """
+    ids = json.dumps(member_ids)
+    wallet_cache.flush()
+    with group_commit.write(durable=True):
+        cleared = _execute(
+            "SELECT id, coin FROM AMOUNTS WHERE id IN (SELECT value FROM json_each(?))", (ids,)).fetchall()
+        _execute("DELETE FROM AMOUNTS WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        ledger.remove_histories(member_ids)
+        balance_history.remove_histories(member_ids)
+    wallet_cache.invalidate()
+    load_leaderboard()
+    return cleared
+
+
+wallet_cache.writer = _write_amounts
+group_commit.add_flush_hook(wallet_cache.flush)
 
 
-def add_transaction(member_id: int, amount: int):
+def add_transaction(member_id: int, amount: int, guild_id: Optional[int] = None, memo: Optional[str] = None,
+                    durable: bool = False):
     """
     Adds a transaction entry for a specific member
     :param member_id:
     :param amount:
+    :param guild_id:
+    :param memo:
+    :param durable:
     :return:
     """
-    cur = connection.cursor()
-    cur.execute("INSERT INTO TRANSACTIONS(date, id, coin) VALUES (?, ?, ?)",
-                (datetime.utcnow(), member_id, amount))
-    connection.commit()
+    ledger.record(member_id, amount, guild_id=guild_id, memo=memo, durable=durable)
 
 
-def remove_transactions(member_id: int):
+def remove_transactions(member_id: int, durable: bool = False):
     """
     Removes all transactions associated with a user
     :param member_id:
+    :param durable:
     :return:
     """
-    cur = connection.cursor()
-    cur.execute("DELETE FROM TRANSACTIONS WHERE id is '{0}'".format(member_id))
-    connection.commit()
+    ledger.remove_history(member_id, durable=durable)
 
 
 def get_coin_rankings():
     """
-    Gets rankings of coin amounts
+    Gets rankings of coin amounts, lowest first
     :return:
     """
-    cur = connection.cursor()
-    amounts = cur.execute("SELECT id, coin FROM AMOUNTS ORDER BY coin").fetchall()
+    amounts = _execute("SELECT id, coin FROM AMOUNTS WHERE coin IS NOT NULL ORDER BY coin").fetchall()
     if amounts:
         return amounts
     return None
 
 
-def update_correct_answer_count(user_id: int):
+def load_leaderboard():
+    """Seeds the in-memory leaderboard from AMOUNTS, read in order off the coin index"""
+    leaderboard.seed(get_coin_rankings() or [])
+
+
+def update_correct_answer_count(user_id: int, durable: bool = False):
     """
     Adds one to the user's correct answer count if it exists, starts one otherwise
     :param user_id:
+    :param durable:
     :return:
     """
-    cur = connection.cursor()
-    cur.execute("UPDATE AMOUNTS SET correct_answers = correct_answers + 1 WHERE id is (?)", (user_id,))
-    connection.commit()
+    with group_commit.write(durable):
+        _execute("UPDATE AMOUNTS SET correct_answers = correct_answers + 1 WHERE id is (?)", (user_id,))
 
 
-def update_incorrect_answer_count(user_id: int):
+def update_incorrect_answer_count(user_id: int, durable: bool = False):
     """
     Adds one to the user's incorrect answer count if it exists, starts one otherwise
     :param user_id:
+    :param durable:
     :return:
     """
-    cur = connection.cursor()
-    cur.execute("UPDATE AMOUNTS SET incorrect_answers = incorrect_answers + 1 WHERE id is (?)", (user_id,))
-    connection.commit()
+    with group_commit.write(durable):
+        _execute("UPDATE AMOUNTS SET incorrect_answers = incorrect_answers + 1 WHERE id is (?)", (user_id,))
 
 
 def get_answer_counts(user_id: int):
@@ -137,8 +250,7 @@ def get_answer_counts(user_id: int):
     :param user_id:
     :return:
     """
-    cur = connection.cursor()
-    counts = cur.execute(
+    counts = _execute(
         "SELECT correct_answers, incorrect_answers FROM AMOUNTS WHERE id is (?)",
         (user_id,)
     ).fetchone()
@@ -150,8 +262,7 @@ def get_answer_rankings():
     Gets rankings of trivia amounts
     :return:
     """
-    cur = connection.cursor()
-    amounts = cur.execute("SELECT id, correct_answers FROM AMOUNTS ORDER BY coin").fetchall()
+    amounts = _execute("SELECT id, correct_answers FROM AMOUNTS ORDER BY correct_answers").fetchall()
     if amounts:
         return amounts
     return None
@@ -162,116 +273,91 @@ TRIVIA
 """
 
 
-def serialize_user_list(users: List[int]) -> str:
-    obj = {'users': users}
-    return json.dumps(obj)
-
-
-def deserialize_user_list(users: str) -> List[int]:
-    users_json = json.loads(users)
-    return users_json['users'] if users_json['users'] else []
-
-
 def get_channels():
     """
     Gets all channels to send trivia question to
     :return:
     """
-    cur = connection.cursor()
-    channels = cur.execute('SELECT channel_id, message_id, reward FROM TRIVIA_CHANNELS').fetchall()
+    channels = _execute('SELECT channel_id, message_id, reward FROM TRIVIA_CHANNELS').fetchall()
     if channels:
         return channels
     return None
 
 
-def get_correct_users(channel_id: int) -> List[int]:
-    """Gets all users with a correct answer for the channel"""
-    cur = connection.cursor()
-    users = cur.execute('SELECT correct_users FROM TRIVIA_CHANNELS WHERE channel_id = (?)', (channel_id,)).fetchone()
-    if users is None:
-        return "[]"
-    return deserialize_user_list(users[0])
-
-
-def get_incorrect_users(channel_id: int) -> List[int]:
-    """Gets all users with an incorrect answer for the channel"""
-    cur = connection.cursor()
-    users = cur.execute('SELECT incorrect_users FROM TRIVIA_CHANNELS WHERE channel_id = (?)', (channel_id,)).fetchone()
-    if users is None:
-        return "[]"
-    return deserialize_user_list(users[0])
+def add_trivia_response(channel_id: int, message_id: int, user_id: int, correct: bool,
+                        durable: bool = False) -> bool:
+    """
+    Records a user's answer to a channel's trivia question
+    :param channel_id:
+    :param message_id:
+    :param user_id:
+    :param correct:
+    :param durable:
+    :return: False if the user had already answered this question
+    """
+    with group_commit.write(durable):
+        inserted = _execute(
+            "INSERT OR IGNORE INTO TRIVIA_RESPONSES(channel_id, message_id, user_id, correct, answered_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (channel_id, message_id, user_id, correct, datetime.utcnow())
+        ).rowcount
+    return inserted == 1
+
+
+def get_trivia_responses(channel_id: int, message_id: int) -> Tuple[List[int], List[int]]:
+    """Gets the users with a correct and with an incorrect answer to a channel's trivia question, in answer order"""
+    rows = _execute(
+        "SELECT user_id, correct FROM TRIVIA_RESPONSES WHERE channel_id = ? AND message_id = ? ORDER BY answered_at",
+        (channel_id, message_id)
+    ).fetchall()
+    correct_users = [user_id for user_id, correct in rows if correct]
+    incorrect_users = [user_id for user_id, correct in rows if not correct]
+    return correct_users, incorrect_users
 
 
 def add_channel(channel_id: int) -> None:
     """Adds a channel to the list of channels enabled for trivia questions"""
-    cur = connection.cursor()
-    cur.execute('INSERT OR IGNORE INTO TRIVIA_CHANNELS(channel_id, message_id, reward) VALUES (?, ?, ?)',
-                (channel_id, 0, 25))
-    connection.commit()
+    with group_commit.write(durable=True):
+        _execute('INSERT OR IGNORE INTO TRIVIA_CHANNELS(channel_id, message_id, reward) VALUES (?, ?, ?)',
+                 (channel_id, 0, 25))
 
 
 def update_message_id(channel_id: int, message_id: int) -> None:
-    """Adds a new message for a specific channel and resets correct and incorrect users"""
-    cur = connection.cursor()
-    empty_user_list = serialize_user_list([])
-    cur.execute("UPDATE TRIVIA_CHANNELS "
-                "SET message_id = (?), correct_users = (?), incorrect_users = (?) "
-                "WHERE channel_id = (?)",
-                (message_id, empty_user_list, empty_user_list, channel_id))
-    connection.commit()
+    """Sets the current trivia message for a specific channel, answers are tracked per message"""
+    with group_commit.write(durable=True):
+        _execute("UPDATE TRIVIA_CHANNELS "
+                 "SET message_id = (?) "
+                 "WHERE channel_id = (?)",
+                 (message_id, channel_id))
 
 
 def update_reward(channel_id: int, reward: int) -> None:
     """Adds a new message for a specific channel and resets correct and incorrect users"""
-    cur = connection.cursor()
-    cur.execute("UPDATE TRIVIA_CHANNELS "
-                "SET reward = (?) "
-                "WHERE channel_id = (?)",
-                (reward, channel_id))
-    connection.commit()
-
-
-def update_correct_users(channel_id: int, correct_users: List[int]) -> None:
-    """Updates the list of correct users for a channel"""
-    cur = connection.cursor()
-    users = serialize_user_list(correct_users)
-    cur.execute("UPDATE TRIVIA_CHANNELS "
-                "SET correct_users = (?) "
-                "WHERE channel_id = (?)",
-                (users, channel_id))
-    connection.commit()
-
-
-def update_incorrect_users(channel_id: int, incorrect_users: List[int]) -> None:
-    """Updates the list of incorrect users for a channel"""
-    cur = connection.cursor()
-    users = serialize_user_list(incorrect_users)
-    cur.execute("UPDATE TRIVIA_CHANNELS "
-                "SET incorrect_users = (?) "
-                "WHERE channel_id = (?)",
-                (users, channel_id))
-    connection.commit()
+    with group_commit.write(durable=True):
+        _execute("UPDATE TRIVIA_CHANNELS "
+                 "SET reward = (?) "
+                 "WHERE channel_id = (?)",
+                 (reward, channel_id))
 
 
 def remove_channel(channel_id: int) -> None:
     """Removes a channel from the list of channels enabled for trivia questions"""
-    cur = connection.cursor()
-    cur.execute("DELETE FROM TRIVIA_CHANNELS WHERE channel_id = (?)",
-                (channel_id,))
-    connection.commit()
-
-
-def get_seen_questions():
-    """Gets all the currently seen questions"""
-    cur = connection.cursor()
-    hashes = cur.execute('SELECT * FROM TRIVIA_HASHES').fetchall()
-    if hashes:
-        return hashes
-    return None
+    with group_commit.write(durable=True):
+        _execute("DELETE FROM TRIVIA_CHANNELS WHERE channel_id = (?)",
+                 (channel_id,))
+
+
+def get_seen_questions() -> Set[int]:
+    """Gets the digests of all the currently seen questions"""
+    return {row[0] for row in _execute('SELECT hash FROM TRIVIA_HASHES').fetchall()}
+
+
+def is_question_seen(question_hash: int) -> bool:
+    """Checks a single question digest against the unique index on TRIVIA_HASHES"""
+    return _execute('SELECT 1 FROM TRIVIA_HASHES WHERE hash = ?', (question_hash,)).fetchone() is not None
 
 
-def add_seen_question(question_hash: int):
-    """Adds a seen hash to the table of hashes"""
-    cur = connection.cursor()
-    cur.execute("INSERT OR IGNORE INTO TRIVIA_HASHES(hash) VALUES (?)", (question_hash,))
-    connection.commit()
+def add_seen_question(question_hash: int, durable: bool = False):
+    """Adds a seen question digest to the table of hashes"""
+    with group_commit.write(durable):
+        _execute("INSERT OR IGNORE INTO TRIVIA_HASHES(hash) VALUES (?)", (question_hash,))
@@ -0,0 +1,20 @@
+from typing import Any, Callable, Dict
+
+StatsProvider = Callable[[], Dict[str, Any]]
+
+_providers: Dict[str, StatsProvider] = {}
+
+
+def register(name: str, provider: StatsProvider) -> None:
+    """
+    Registers a function returning a flat dict of statistics, reported under the given section name by /stats
+    :param name:
+    :param provider:
+    :return:
+    """
+    _providers[name] = provider
+
+
+def collect() -> Dict[str, Dict[str, Any]]:
+    """Gets the current statistics from every registered provider"""
+    return {name: provider() for name, provider in _providers.items()}
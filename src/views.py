@@ -1,10 +1,21 @@
 from typing import Optional
 import discord
 
-from src import bot_helper, config, sql_client
+from src import action_queue, bot_helper, config, db_executor, sql_client
 from src.api_handlers.trivia_handler import Question, QuestionType
 
 
+def _record_answer(channel_id: int, message_id: int, user_id: int, correct: bool) -> bool:
+    """Records the user's answer and updates their answer count, returns False if they had already answered"""
+    if not sql_client.add_trivia_response(channel_id, message_id, user_id, correct):
+        return False
+    if correct:
+        sql_client.update_correct_answer_count(user_id)
+    else:
+        sql_client.update_incorrect_answer_count(user_id)
+    return True
+
+
 class Dropdown(discord.ui.Select):
     def __init__(self, question: Question, disabled: bool, amount: int):
         self.interacted_users = []
@@ -36,31 +47,29 @@ class Dropdown(discord.ui.Select):
         # Select object, and the values attribute gets a list of the user's
         # selected options. We only want the first one.
         if interaction.user.id in self.interacted_users:
-            await interaction.response.send_message("You've already given your response.", ephemeral=True)
+            await action_queue.respond(interaction, "You've already given your response.", ephemeral=True)
+            return
+        correct = self.values[0] == self.question.correct_answer
+        self.interacted_users.append(interaction.user.id)
+        # the unique answer index is what really stops a second answer, the list above only saves a query
+        recorded = await db_executor.run(
+            _record_answer, interaction.channel_id, interaction.message.id, interaction.user.id, correct
+        )
+        if not recorded:
+            await action_queue.respond(interaction, "You've already given your response.", ephemeral=True)
+        elif correct:
+            await bot_helper.add_coin(interaction.guild, interaction.user, self.amount, memo="Trivia reward")
+            await action_queue.respond(
+                interaction,
+                f'Correct answer! You\'ve received {format(self.amount, ",d")} coin!',
+                ephemeral=True
+            )
         else:
-            if self.values[0] == self.question.correct_answer:
-                await bot_helper.add_coin(interaction.guild, interaction.user, self.amount)
-                sql_client.update_correct_answer_count(interaction.user.id)
-                # Updates the channel's list of incorrect users
-                correct_users = sql_client.get_correct_users(interaction.channel_id)
-                correct_users.append(interaction.user.id)
-                sql_client.update_correct_users(interaction.channel_id, correct_users)
-                self.interacted_users.append(interaction.user.id)
-                await interaction.response.send_message(
-                    f'Correct answer! You\'ve received {format(self.amount, ",d")} coin!',
-                    ephemeral=True
-                )
-            else:
-                sql_client.update_incorrect_answer_count(interaction.user.id)
-                # Updates the channel's list of incorrect users
-                incorrect_users = sql_client.get_incorrect_users(interaction.channel_id)
-                incorrect_users.append(interaction.user.id)
-                sql_client.update_incorrect_users(interaction.channel_id, incorrect_users)
-                self.interacted_users.append(interaction.user.id)
-                await interaction.response.send_message(
-                    f'Incorrect answer {config.get_attribute("sadEmote", "")} no coin awarded.',
-                    ephemeral=True
-                )
+            await action_queue.respond(
+                interaction,
+                f'Incorrect answer {config.get_attribute("sadEmote", "")} no coin awarded.',
+                ephemeral=True
+            )
 
 
 class DropdownView(discord.ui.View):
@@ -112,8 +121,8 @@ class QuestionSubmit(discord.ui.Modal, title='Input your question'):
             incorrect_answers=incorrect_answers
         )
         self.submitted_question = q
-        await interaction.response.send_message('Added question to list.', ephemeral=True)
+        await action_queue.respond(interaction, 'Added question to list.', ephemeral=True)
         self.stop()
 
     async def on_error(self, interaction: discord.Interaction, error: Exception) -> None:
-        await interaction.response.send_message('Oops! Something went wrong.', ephemeral=True)
+        await action_queue.respond(interaction, 'Oops! Something went wrong.', ephemeral=True)
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src import config, stats
+
+# returned by get() when the member is not cached, None means the member is cached as having no wallet
+MISSING = object()
+
+
+class WalletCache:
+    """
+    Bounded LRU cache of member coin amounts in front of AMOUNTS.
+    Write-through by default. In write-behind mode changed amounts are only marked dirty and
+    are written together by the flush hook right before the group commit batch closes.
+    """
+
+    def __init__(self, max_size: int, write_behind: bool = False) -> None:
+        self.max_size = max_size
+        self.write_behind = write_behind
+        self._lock = threading.Lock()
+        self._coins: "OrderedDict[int, Optional[int]]" = OrderedDict()
+        self._dirty: Dict[int, int] = {}
+        # writes dirty entries to the database, set by sql_client
+        self.writer: Optional[Callable[[List[Tuple[int, int]]], None]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, member_id: int) -> Any:
+        """A member's cached coin, None if they have no wallet, or MISSING if they aren't cached"""
+        with self._lock:
+            if member_id not in self._coins:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            self._coins.move_to_end(member_id)
+            return self._coins[member_id]
+
+    def put(self, member_id: int, coin: Optional[int], dirty: bool = False) -> None:
+        with self._lock:
+            self._coins[member_id] = coin
+            self._coins.move_to_end(member_id)
+            if dirty and coin is not None:
+                self._dirty[member_id] = coin
+            else:
+                self._dirty.pop(member_id, None)
+            evicted = self._evict()
+        # evicted entries with unwritten amounts are written before they are forgotten
+        if evicted and self.writer:
+            self.writer(evicted)
+
+    def invalidate(self, member_id: Optional[int] = None) -> None:
+        """Forgets one member, or everyone when no member is given. Dirty amounts should be flushed first."""
+        with self._lock:
+            if member_id is None:
+                self._coins.clear()
+                self._dirty.clear()
+            else:
+                self._coins.pop(member_id, None)
+                self._dirty.pop(member_id, None)
+
+    def take_dirty(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            dirty = list(self._dirty.items())
+            self._dirty.clear()
+            return dirty
+
+    def flush(self) -> None:
+        """Writes every dirty amount, run by group commit right before the batch commits"""
+        dirty = self.take_dirty()
+        if dirty and self.writer:
+            self.writer(dirty)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._coins),
+            "max_size": self.max_size,
+            "mode": "write-behind" if self.write_behind else "write-through",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{100 * self.hits / lookups:.1f}%" if lookups else "n/a",
+            "evictions": self.evictions,
+            "dirty": len(self._dirty),
+        }
+
+    def _evict(self) -> List[Tuple[int, int]]:
+        evicted = []
+        while len(self._coins) > self.max_size:
+            member_id, _coin = self._coins.popitem(last=False)
+            self.evictions += 1
+            if member_id in self._dirty:
+                evicted.append((member_id, self._dirty.pop(member_id)))
+        return evicted
+
+
+wallet_cache = WalletCache(
+    config.get_attribute("walletCacheSize", 1024),
+    write_behind=config.get_attribute("walletWriteBehind", False),
+)
+stats.register("wallet cache", wallet_cache.get_stats)